@@ -0,0 +1,67 @@
+"""
+Runs the build pipeline benchmarks against local stand-ins.
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --compare baseline.json --output results.json
+
+Results are medians of repeated runs in seconds per operation, stored with the commit they were taken on. With
+`--compare`, benchmarks whose median got slower than `--threshold` are reported and the exit status is 1.
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+import sys
+from tempfile import TemporaryDirectory
+
+ROOT = Path(__file__).parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.splitlines()[1])
+    parser.add_argument("names", nargs="*", help="benchmarks to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="smaller fixtures and fewer repeats")
+    parser.add_argument("--sizes", default=None, help="comma separated build counts for listing (default: 1000,10000)")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="compare against earlier JSON results")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown before failing (default: 0.1)")
+    parser.add_argument("--verbose", action="store_true", help="show log output of the code under test")
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix="wbld-bench-") as tempdir:
+        workdir = Path(tempdir)
+        # wbld.web serves the storage directory, so it has to exist before anything from wbld is imported.
+        os.environ["STORAGE_DIR"] = str(workdir.joinpath("storage"))
+        workdir.joinpath("storage").mkdir()
+        os.chdir(ROOT)
+
+        from benchmarks import pipeline  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
+        from benchmarks.harness import BENCHMARKS, compare, Suite, write  # pylint: disable=import-outside-toplevel
+        from wbld.log import logger  # pylint: disable=import-outside-toplevel
+
+        if not args.verbose:
+            logger.remove(0)
+
+        sizes = [int(size) for size in (args.sizes or ("1000" if args.quick else "1000,10000")).split(",")]
+        suite = Suite(quick=args.quick, sizes=sizes)
+
+        for name, func in BENCHMARKS.items():
+            if not args.names or name in args.names:
+                bench_dir = workdir.joinpath(name)
+                bench_dir.mkdir()
+                func(suite, bench_dir)
+                # Builders change the working directory, make sure it's not left inside the fixtures.
+                os.chdir(ROOT)
+
+    if args.output:
+        write(args.output, suite)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(json.load(baseline), {"results": suite.results}, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Local stand-ins for the services and tools the build pipeline talks to.
+"""
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from pathlib import Path
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import shortuuid
+
+from wbld.build.enums import Kind, State
+
+SHA1 = "5d6b97a63e4357f09f561f06355b2965be52ace7"
+PLATFORMIO_INI = """[platformio]
+default_envs = bench
+
+[env:bench]
+platform = fake
+board = fake
+"""
+
+
+def git(path: Path, *args):
+    subprocess.run(["git", "-C", str(path), *args], check=True, capture_output=True)
+
+
+def bare_repository(path: Path, files=1500, commits=10, size=8192) -> Path:
+    """
+    Creates a bare repository shaped roughly like WLED: a PlatformIO project with sources and web UI assets spread
+    over a few directories and a short history. Returns the path of the bare repository.
+    """
+    rng = random.Random(0)
+    work = path.joinpath("work")
+    work.mkdir(parents=True)
+    git(work, "init", "-q", "-b", "main")
+    git(work, "config", "user.email", "bench@wbld.app")
+    git(work, "config", "user.name", "bench")
+    work.joinpath("platformio.ini").write_text(PLATFORMIO_INI)
+
+    directories = ["wled00", "wled00/src/dependencies", "wled00/data", "usermods", "images", "tools"]
+    for commit in range(commits):
+        for index in range(commit, files, commits):
+            file = work.joinpath(directories[index % len(directories)], f"file{index}.cpp")
+            file.parent.mkdir(parents=True, exist_ok=True)
+            file.write_bytes(rng.randbytes(size // 2).hex().encode())
+        git(work, "add", "-A")
+        git(work, "commit", "-q", "-m", f"Commit {commit}")
+    git(work, "tag", "v0.1.0")
+
+    bare = path.joinpath("WLED.git")
+    subprocess.run(["git", "clone", "-q", "--bare", str(work), str(bare)], check=True)
+    # Lets clones ask for a partial clone without blobs, like GitHub does.
+    git(bare, "config", "uploadpack.allowFilter", "true")
+    return bare
+
+
+class GithubHandler(BaseHTTPRequestHandler):
+    """
+    Answers the handful of GitHub API calls `Reference` makes for `Aircoookie/WLED`.
+    """
+
+    latency = 0.0
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _commit(self, sha):
+        base = f"http://{self.headers['Host']}/repos/Aircoookie/WLED"
+        return {"sha": sha, "url": f"{base}/commits/{sha}", "commit": {"message": "Bench commit"}}
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        time.sleep(self.latency)
+        parts = self.path.split("?")[0].strip("/").split("/")
+        base = f"http://{self.headers['Host']}/repos/Aircoookie/WLED"
+
+        if parts == ["repos", "Aircoookie", "WLED"]:
+            self._json(200, {"full_name": "Aircoookie/WLED", "name": "WLED", "url": base, "html_url": base})
+        elif parts[3:4] == ["commits"] and len(parts[4]) == 40:
+            self._json(200, self._commit(parts[4]))
+        elif parts[3:4] == ["branches"] and parts[4] == "main":
+            self._json(200, {"name": "main", "commit": self._commit(SHA1)})
+        elif parts[3:4] == ["tags"]:
+            self._json(200, [{"name": f"v0.{index}.0", "commit": self._commit(SHA1)} for index in range(30)])
+        else:
+            self._json(404, {"message": "Not Found"})
+
+
+@contextmanager
+def github_server(latency=0.0):
+    handler = type("Handler", (GithubHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def synthetic_builds(path: Path, count: int):
+    """
+    Writes `count` build directories with a `build.json` each, without going through pydantic.
+    """
+    rng = random.Random(count)
+    path.mkdir(parents=True, exist_ok=True)
+    for _ in range(count):
+        build = path.joinpath(shortuuid.uuid())
+        build.mkdir()
+        build.joinpath("build.json").write_text(
+            json.dumps(
+                {
+                    "author": None,
+                    "duration": rng.uniform(30, 300),
+                    "env": rng.choice(["d1_mini", "esp32dev", "nodemcuv2", "esp01_1m_full"]),
+                    "jobs": 2,
+                    "kind": int(rng.choice(list(Kind))),
+                    "reason": None,
+                    "sha1": SHA1,
+                    "snippet": None,
+                    "state": int(rng.choice([State.SUCCESS, State.SUCCESS, State.FAILED])),
+                    "version": "main",
+                }
+            )
+        )
+
+
+class FakePlatform:
+    """
+    Stands in for a PlatformIO platform. `run` prints compiler lines, sleeps and writes a firmware binary.
+    """
+
+    objects = 50
+    duration = 0.5
+
+    def __init__(self, name):
+        self.name = name
+
+    @classmethod
+    def new(cls, name):
+        return cls(name)
+
+    def run(self, variables, targets, silent, verbose, jobs):  # pylint: disable=too-many-arguments,unused-argument
+        env = variables["pioenv"]
+        for index in range(self.objects):
+            print(f"Compiling .pio/build/{env}/src/file{index}.cpp.o")
+            time.sleep(self.duration / self.objects)
+        sys.stdout.flush()
+        firmware = Path(".pio", "build", env, "firmware.bin")
+        firmware.parent.mkdir(parents=True, exist_ok=True)
+        firmware.write_bytes(os.urandom(1024 * 1024))
+        return {"returncode": 0}
+
+
+def project(path: Path) -> Path:
+    path.mkdir(parents=True, exist_ok=True)
+    path.joinpath("platformio.ini").write_text(PLATFORMIO_INI)
+    return path
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import platform
+from statistics import mean, median
+import subprocess
+from timeit import default_timer as timer
+from typing import Callable, Dict, List
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(func):
+    """
+    Registers a benchmark. It's called with the `Suite` and records its own measurements through it.
+    """
+    BENCHMARKS[func.__name__.replace("bench_", "")] = func
+    return func
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class Suite:
+    """
+    Collects timings as seconds per operation. Every measurement is repeated, so results include the spread.
+    """
+
+    def __init__(self, quick=False, sizes=(1000,)):
+        self.quick = quick
+        self.sizes = sizes
+        self.results: Dict[str, dict] = {}
+
+    def record(self, name: str, samples: List[float], operations: int = 1, **extra):
+        per_op = [sample / operations for sample in samples]
+        self.results[name] = {
+            "samples": len(per_op),
+            "min": min(per_op),
+            "median": median(per_op),
+            "mean": mean(per_op),
+            "p95": percentile(per_op, 95),
+            "ops_per_sec": 1 / median(per_op) if median(per_op) else None,
+            **extra,
+        }
+        print(f"{name:<48} {median(per_op) * 1000:>12.3f} ms/op  (p95 {percentile(per_op, 95) * 1000:.3f} ms)")
+
+    def measure(self, name: str, func: Callable, repeat: int = 5, operations: int = 1, setup: Callable = None):
+        samples = []
+        for _ in range(repeat):
+            if setup:
+                setup()
+            start = timer()
+            func()
+            samples.append(timer() - start)
+        self.record(name, samples, operations)
+
+    def measure_async(self, name: str, func: Callable, repeat: int = 5, operations: int = 1):
+        async def run():
+            samples = []
+            for _ in range(repeat):
+                start = timer()
+                await func()
+                samples.append(timer() - start)
+            return samples
+
+        self.record(name, asyncio.run(run()), operations)
+
+
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "machine": platform.machine()}
+
+
+def compare(old: dict, new: dict, threshold: float) -> List[str]:
+    """
+    Prints the change of the median of every benchmark in both result sets and returns those that got slower than
+    the threshold allows.
+    """
+    regressions = []
+    print(f"{'benchmark':<48} {'old':>12} {'new':>12} {'change':>8}")
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        before, after = old["results"][name]["median"], result["median"]
+        change = after / before - 1 if before else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<48} {before * 1000:>10.3f}ms {after * 1000:>10.3f}ms {change:>+8.1%}{flag}")
+    return regressions
+
+
+def write(path: str, suite: Suite):
+    with open(path, "w") as output:
+        json.dump(
+            {**metadata(), "quick": suite.quick, "sizes": suite.sizes, "results": suite.results},
+            output,
+            indent=2,
+            sort_keys=True,
+        )
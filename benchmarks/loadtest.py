@@ -0,0 +1,419 @@
+"""
+Simulates many Discord users building firmware at the same time.
+
+    python -m benchmarks.loadtest --users 50 --ramp 30 --concurrency 2 --duration lognormal:20,0.5
+
+Drives `WbldCog` with fake command contexts and a fake Discord transport which answers every send and edit after a
+sampled latency. Cloning and building are stubbed with configurable duration distributions, everything else (journal,
+build records, status updates) is the real code. Reports queue wait, end-to-end latency, event loop lag and error
+rates so worker pools and concurrency limits can be sized before release day.
+"""
+import argparse
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+import itertools
+import json
+import math
+from pathlib import Path
+import random
+from tempfile import TemporaryDirectory
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import discord
+
+from benchmarks.fixtures import SHA1
+from benchmarks.harness import percentile
+from wbld.build.enums import Kind, State
+from wbld.build.models import BuildModel
+from wbld.build.storage import Storage
+from wbld.cogs import wbld as cog_module
+from wbld.cogs.wbld import WbldCog
+from wbld.diagnostics import LoopMonitor
+from wbld.status import StatusUpdater
+
+ENVS = ["d1_mini", "esp32dev", "nodemcuv2", "esp01_1m_full", "esp32_eth"]
+SNIPPET = """[env:loadtest]
+board = esp32dev
+platform = espressif32@2.1.0
+build_flags = ${common.build_flags_esp32} -D USE_APA102
+"""
+
+current: ContextVar["Request"] = ContextVar("current")
+
+
+class Distribution:
+    """
+    Samples durations in seconds from a spec like `fixed:60`, `uniform:30,90`, `normal:60,15` or `lognormal:60,0.5`.
+    The lognormal parameters are the median and the sigma of the underlying normal distribution.
+    """
+
+    def __init__(self, spec: str, rng: random.Random):
+        name, _, args = spec.partition(":")
+        self.spec = spec
+        self.name = name
+        self.args = [float(arg) for arg in args.split(",") if arg]
+        self.rng = rng
+        if name not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown distribution: {spec}")
+
+    def sample(self) -> float:
+        if self.name == "fixed":
+            value = self.args[0]
+        elif self.name == "uniform":
+            value = self.rng.uniform(*self.args)
+        elif self.name == "normal":
+            value = self.rng.gauss(*self.args)
+        else:
+            value = self.args[0] * math.exp(self.rng.gauss(0, self.args[1]))
+        return max(0.0, value)
+
+
+@dataclass
+class Request:
+    user: int
+    kind: Kind
+    issued: float
+    queued: Optional[float] = None
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    state: Optional[State] = None
+    error: Optional[str] = None
+
+
+class Transport:
+    """
+    Stands in for the Discord API. Every call takes a sampled latency and is recorded.
+    """
+
+    def __init__(self, latency: Distribution):
+        self.latency = latency
+        self.ids = itertools.count(1)
+        self.calls: Dict[str, List[float]] = {"send": [], "edit": []}
+
+    async def call(self, kind: str):
+        delay = self.latency.sample()
+        await asyncio.sleep(delay)
+        self.calls[kind].append(delay)
+
+
+class FakeMessage:
+    def __init__(self, transport: Transport, channel: "FakeChannel", author=None, content: str = None):
+        self.transport = transport
+        self.id = next(transport.ids)
+        self.channel = channel
+        self.author = author
+        self.content = content
+
+    async def edit(self, content=None, **kwargs):  # pylint: disable=unused-argument
+        await self.transport.call("edit")
+        self.content = content
+
+
+class FakeChannel:
+    def __init__(self, transport: Transport):
+        self.transport = transport
+        self.id = next(transport.ids)
+
+    async def send(self, content=None, **kwargs):  # pylint: disable=unused-argument
+        await self.transport.call("send")
+        return FakeMessage(self.transport, self, content=content)
+
+
+class FakeContext:
+    prefix = "./"
+
+    def __init__(self, channel: FakeChannel, author: discord.User, content: str):
+        self.channel = channel
+        self.author = author
+        self.message = FakeMessage(channel.transport, channel, author, content)
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeBot:
+    """
+    Answers `wait_for` with the configuration snippets virtual users posted after a sampled typing delay.
+    """
+
+    def __init__(self, typing: Distribution):
+        self.typing = typing
+        self.replies: List[FakeMessage] = []
+
+    async def wait_for(self, event, check, timeout):  # pylint: disable=unused-argument
+        await asyncio.sleep(min(timeout, self.typing.sample()))
+        for message in self.replies:
+            if check(message):
+                self.replies.remove(message)
+                return message
+        raise asyncio.TimeoutError
+
+
+class SimulatedCog(WbldCog):
+    def _enqueue(self, ctx, kind, version, env_or_snippet):
+        current.get().queued = time.monotonic()
+        return super()._enqueue(ctx, kind, version, env_or_snippet)
+
+
+class Simulation:
+    """
+    Ramps up `users` virtual users evenly over `ramp` seconds. Each user issues `commands` build commands one after
+    the other, waiting a sampled think time in between; `custom_ratio` of them are custom builds.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+    def __init__(
+        self,
+        users=20,
+        commands=1,
+        ramp=10.0,
+        concurrency=2,
+        channels=1,
+        custom_ratio=0.2,
+        failure_rate=0.05,
+        duration="lognormal:10,0.5",
+        clone="fixed:0.5",
+        latency="lognormal:0.08,0.5",
+        typing="uniform:2,10",
+        think="uniform:5,30",
+        seed=0,
+        status: StatusUpdater = None,
+    ):
+        self.rng = random.Random(seed)
+        self.users = users
+        self.commands = commands
+        self.ramp = ramp
+        self.concurrency = concurrency
+        self.custom_ratio = custom_ratio
+        self.failure_rate = failure_rate
+        self.duration = Distribution(duration, self.rng)
+        self.clone = Distribution(clone, self.rng)
+        self.think = Distribution(think, self.rng)
+        self.transport = Transport(Distribution(latency, self.rng))
+        self.bot = FakeBot(Distribution(typing, self.rng))
+        self.channels = [FakeChannel(self.transport) for _ in range(channels)]
+        self.status = status
+        self.requests: List[Request] = []
+        self.monitor = LoopMonitor(interval=0.05, threshold=0.1, history=None)
+        self.elapsed = 0.0
+
+    @contextmanager
+    def stubs(self):
+        """
+        Replaces cloning and building in the cog with stand-ins that take a sampled time.
+        """
+        simulation = self
+
+        class FakeClone:
+            def __init__(self, version):
+                self.version = version
+                self.sha1 = SHA1
+
+            def clone_version(self):
+                # The real clone blocks the event loop as well, so this shows up as lag.
+                time.sleep(simulation.clone.sample())
+                return SimpleNamespace(hexsha=SHA1)
+
+            def cleanup(self):
+                pass
+
+        class FakeBuilder:
+            def __init__(self, clone, env_or_snippet, kind):
+                custom = kind == Kind.CUSTOM
+                self.build = BuildModel(
+                    env="loadtest" if custom else env_or_snippet,
+                    kind=kind,
+                    sha1=clone.sha1,
+                    snippet=env_or_snippet if custom else None,
+                    version=clone.version,
+                )
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+        class FakeRunner:
+            steps = 10
+
+            def __init__(self, builder, progress=None, started=None):
+                self.builder = builder
+                self.progress = progress
+
+            async def run(self):
+                request = current.get()
+                request.started = time.monotonic()
+                build = self.builder.build
+                build.state = State.BUILDING
+                duration = simulation.duration.sample()
+                for step in range(self.steps):
+                    await asyncio.sleep(duration / self.steps)
+                    if self.progress:
+                        self.progress(step + 1, self.steps)
+
+                build.duration = duration
+                if simulation.rng.random() < simulation.failure_rate:
+                    build.reason = "Exit code 1"
+                    build.state = State.FAILED
+                else:
+                    build.file_binary.write_bytes(b"\0" * 1024)
+                    build.state = State.SUCCESS
+                request.state = build.state
+                return build
+
+        replaced = {
+            "Clone": FakeClone,
+            "Runner": FakeRunner,
+            "builder_class": lambda kind: lambda clone, payload: FakeBuilder(clone, payload, kind),
+        }
+        originals = {name: getattr(cog_module, name) for name in replaced}
+        for name, value in replaced.items():
+            setattr(cog_module, name, value)
+        try:
+            yield
+        finally:
+            for name, value in originals.items():
+                setattr(cog_module, name, value)
+
+    async def _user(self, cog: WbldCog, index: int, delay: float):
+        await asyncio.sleep(delay)
+        author = discord.User(
+            state=None, data={"id": 1000 + index, "username": f"user{index}", "discriminator": "0001", "avatar": None}
+        )
+        channel = self.channels[index % len(self.channels)]
+
+        for command in range(self.commands):
+            if command:
+                await asyncio.sleep(self.think.sample())
+
+            custom = self.rng.random() < self.custom_ratio
+            request = Request(user=index, kind=Kind.CUSTOM if custom else Kind.BUILTIN, issued=time.monotonic())
+            self.requests.append(request)
+            token = current.set(request)
+            try:
+                if custom:
+                    ctx = FakeContext(channel, author, "./build custom")
+                    self.bot.replies.append(FakeMessage(self.transport, channel, author, SNIPPET))
+                    await cog.custom.callback(cog, ctx)
+                else:
+                    env = self.rng.choice(ENVS)
+                    ctx = FakeContext(channel, author, f"./build builtin {env}")
+                    await cog.builtin.callback(cog, ctx, env)
+            except Exception as error:  # pylint: disable=broad-except
+                request.error = f"{type(error).__name__}: {error}"
+            finally:
+                request.finished = time.monotonic()
+                current.reset(token)
+
+    async def run(self) -> dict:
+        cog = SimulatedCog(self.bot, "http://localhost:8090", "main", concurrency=self.concurrency)
+        if self.status:
+            cog.status = self.status
+
+        with self.stubs():
+            self.monitor.start()
+            start = time.monotonic()
+            step = self.ramp / max(1, self.users - 1)
+            await asyncio.gather(*[self._user(cog, index, index * step) for index in range(self.users)])
+            self.elapsed = time.monotonic() - start
+            for channel in self.channels:
+                await cog.status.flush(channel.id)
+            self.monitor.stop()
+
+        return self.report()
+
+    def report(self) -> dict:
+        def summary(samples):
+            if not samples:
+                return None
+            return {
+                "p50": percentile(samples, 50),
+                "p90": percentile(samples, 90),
+                "p99": percentile(samples, 99),
+                "max": max(samples),
+            }
+
+        builds = [request for request in self.requests if request.started]
+        return {
+            "requests": len(self.requests),
+            "custom": sum(1 for request in self.requests if request.kind == Kind.CUSTOM),
+            "errors": sum(1 for request in self.requests if request.error),
+            "failed": sum(1 for request in self.requests if request.state == State.FAILED),
+            "elapsed": self.elapsed,
+            "throughput": len(builds) / self.elapsed * 60 if self.elapsed else 0.0,
+            "queue_wait": summary([request.started - request.queued for request in builds if request.queued]),
+            "end_to_end": summary([request.finished - request.issued for request in self.requests]),
+            "loop_lag": summary(list(self.monitor.lags)),
+            "loop_stalls": dict(self.monitor.locations),
+            "discord_send": summary(self.transport.calls["send"]),
+            "discord_edit": summary(self.transport.calls["edit"]),
+            "sends": len(self.transport.calls["send"]),
+            "edits": len(self.transport.calls["edit"]),
+            "error_messages": sorted({request.error for request in self.requests if request.error}),
+        }
+
+
+def print_report(report: dict):
+    requests = max(1, report["requests"])
+    print(
+        f"{report['requests']} requests ({report['custom']} custom) in {report['elapsed']:.1f} s, "
+        f"{report['throughput']:.1f} builds/min"
+    )
+    print(f"errors: {report['errors']} ({report['errors'] / requests:.1%})")
+    print(f"failed builds: {report['failed']} ({report['failed'] / requests:.1%})")
+    print(f"discord calls: {report['sends']} sends, {report['edits']} edits")
+    print()
+    print(f"{'':<16} {'p50':>10} {'p90':>10} {'p99':>10} {'max':>10}")
+    for name in ("queue_wait", "end_to_end", "loop_lag", "discord_send", "discord_edit"):
+        values = report[name]
+        if values:
+            columns = " ".join(f"{values[key]:>9.3f}s" for key in ("p50", "p90", "p99", "max"))
+            print(f"{name:<16} {columns}")
+    for location, count in sorted(report["loop_stalls"].items(), key=lambda item: -item[1]):
+        print(f"loop blocked {count}x in {location}")
+    for message in report["error_messages"]:
+        print(f"error: {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest", description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20, help="number of virtual users (default: 20)")
+    parser.add_argument("--commands", type=int, default=1, help="build commands per user (default: 1)")
+    parser.add_argument("--ramp", type=float, default=10.0, help="seconds until all users are active (default: 10)")
+    parser.add_argument("--concurrency", type=int, default=2, help="build slots of the bot (default: 2)")
+    parser.add_argument("--channels", type=int, default=1, help="channels the users are spread over (default: 1)")
+    parser.add_argument("--custom-ratio", type=float, default=0.2, help="share of custom builds (default: 0.2)")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="share of failing builds (default: 0.05)")
+    parser.add_argument("--duration", default="lognormal:10,0.5", help="build duration distribution")
+    parser.add_argument("--clone", default="fixed:0.5", help="clone duration distribution, blocks the event loop")
+    parser.add_argument("--latency", default="lognormal:0.08,0.5", help="Discord API latency distribution")
+    parser.add_argument("--typing", default="uniform:2,10", help="time users take to paste a custom snippet")
+    parser.add_argument("--think", default="uniform:5,30", help="time between commands of one user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show log output of the bot")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        from wbld.log import logger  # pylint: disable=import-outside-toplevel
+
+        logger.remove(0)
+
+    options = {key: value for key, value in vars(args).items() if key not in ("output", "verbose")}
+    with TemporaryDirectory(prefix="wbld-loadtest-") as tempdir:
+        Storage.base_path = Path(tempdir)
+        report = asyncio.run(Simulation(**options).run())
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"options": options, **report}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
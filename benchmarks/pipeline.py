@@ -0,0 +1,176 @@
+import asyncio
+import os
+from pathlib import Path
+from timeit import default_timer as timer
+
+from aiohttp import ClientSession, TCPConnector, WSMsgType
+from aiohttp.test_utils import TestServer
+
+from benchmarks import fixtures
+from benchmarks.harness import benchmark, Suite
+from wbld.build import Manager
+from wbld.build.analytics import BuildAnalytics
+from wbld.build.enums import Kind
+from wbld.build.index import BuildIndex
+from wbld.build.models import BuildModel, BuildRecord
+from wbld.build.runner import Runner
+from wbld.build.storage import Storage
+from wbld.repository import Clone, Reference, ReferenceException
+
+
+@benchmark
+def bench_clone(suite: Suite, workdir: Path):
+    bare = fixtures.bare_repository(workdir.joinpath("git"), files=300 if suite.quick else 1500)
+
+    for mode, sparse in (("clone_version", False), ("sparse", True)):
+        samples, sizes = [], []
+        for _ in range(3 if suite.quick else 5):
+            start = timer()
+            repository = Clone("main", url=bare.as_uri(), sparse=sparse)
+            repository.clone_version()
+            samples.append(timer() - start)
+            sizes.append(sum(file.stat().st_size for file in repository.path.rglob("*") if file.is_file()))
+            repository.cleanup()
+        suite.record(f"clone.{mode}", samples, disk_bytes=max(sizes))
+
+
+@benchmark
+def bench_reference(suite: Suite, workdir: Path):  # pylint: disable=unused-argument
+    def missing():
+        try:
+            Reference("does-not-exist")
+        except ReferenceException:
+            pass
+
+    with fixtures.github_server() as url:
+        os.environ["GITHUB_API_URL"] = url
+        repeat = 10 if suite.quick else 50
+        suite.measure("reference.commit", lambda: Reference(fixtures.SHA1), repeat=repeat)
+        suite.measure("reference.missing", missing, repeat=repeat)
+
+
+@benchmark
+def bench_listing(suite: Suite, workdir: Path):
+    async def fetch(session, url):
+        async with session.get(url) as response:
+            await response.read()
+            assert response.status == 200
+
+    async def page(count):
+        from wbld.web import create_app  # pylint: disable=import-outside-toplevel
+
+        async with TestServer(create_app()) as server, ClientSession() as session:
+            samples = []
+            for _ in range(3):
+                start = timer()
+                await fetch(session, str(server.make_url("/")))
+                samples.append(timer() - start)
+            suite.record(f"web.index.{count}", samples)
+
+    for count in suite.sizes:
+        Storage.base_path = workdir.joinpath(f"builds-{count}")
+        fixtures.synthetic_builds(Storage.base_path, count)
+        suite.measure(f"manager.list_builds.{count}", lambda: sum(1 for _ in Manager.list_builds()), repeat=3)
+        suite.measure(f"index.scan.{count}", lambda: BuildIndex.refresh(force=True), repeat=3)
+        suite.measure(f"index.query.{count}", lambda: BuildIndex.query(limit=50), repeat=10)
+        # A full aggregation after a restart, then a refresh after some build changed.
+        reset = BuildAnalytics._reset  # pylint: disable=protected-access
+        suite.measure(f"analytics.full.{count}", BuildAnalytics.summary, repeat=3, setup=reset)
+        suite.measure(
+            f"analytics.refresh.{count}",
+            BuildAnalytics.summary,
+            repeat=10,
+            setup=lambda: setattr(BuildAnalytics, "generation", None),
+        )
+        asyncio.run(page(count))
+
+
+@benchmark
+def bench_model(suite: Suite, workdir: Path):
+    Storage.base_path = workdir.joinpath("model")
+    Storage.create()
+    build = BuildModel(kind=Kind.BUILTIN, env="d1_mini", version="main", sha1=fixtures.SHA1)
+    operations = 200 if suite.quick else 1000
+
+    def write():
+        for _ in range(operations):
+            build.write()
+
+    def parse():
+        for _ in range(operations):
+            BuildModel.parse_build_path(build.path)
+
+    def load():
+        for _ in range(operations):
+            BuildRecord.load(build.path)
+
+    suite.measure("model.write", write, operations=operations)
+    suite.measure("model.parse", parse, operations=operations)
+    suite.measure("record.load", load, operations=operations)
+
+
+@benchmark
+def bench_websocket(suite: Suite, workdir: Path):  # pylint: disable=unused-argument
+    from wbld.web import create_app  # pylint: disable=import-outside-toplevel
+
+    clients = 100 if suite.quick else 500
+
+    async def receive_build(ws):
+        async for msg in ws:
+            if msg.type == WSMsgType.TEXT and msg.json().get("action") == "build":
+                return
+
+    async def run():
+        async with TestServer(create_app()) as server, ClientSession(connector=TCPConnector(limit=0)) as session:
+            url = str(server.make_url("/ws"))
+            sockets = [await session.ws_connect(url) for _ in range(clients)]
+            for ws in sockets:
+                await ws.receive()
+                await ws.send_json({"action": "join"})
+            sender = await session.ws_connect(url)
+            await sender.receive()
+            await asyncio.sleep(0.1)
+
+            samples = []
+            for _ in range(5):
+                start = timer()
+                await sender.send_json({"action": "build", "state": "bench"})
+                await asyncio.gather(*[receive_build(ws) for ws in sockets])
+                samples.append(timer() - start)
+
+            for ws in [sender, *sockets]:
+                await ws.close()
+            return samples
+
+    suite.record(f"websocket.fanout.{clients}", asyncio.run(run()))
+
+
+@benchmark
+def bench_end_to_end(suite: Suite, workdir: Path):
+    from wbld.build import builder  # pylint: disable=import-outside-toplevel
+
+    builder.PlatformFactory = fixtures.FakePlatform
+    Storage.base_path = workdir.joinpath("e2e")
+    Storage.create()
+
+    def make_builder(index):
+        clone = Clone("main")
+        clone.path = fixtures.project(workdir.joinpath("projects", str(index)))
+        clone.sha1 = fixtures.SHA1
+        return builder.Builder(clone, "bench")
+
+    async def build(index):
+        with make_builder(index) as build_builder:
+            await Runner(build_builder).run()
+
+    for concurrency in (1, 4):
+        samples = []
+        for repeat in range(3):
+            start = timer()
+
+            async def run():
+                await asyncio.gather(*[build(repeat * 10 + index) for index in range(concurrency)])
+
+            asyncio.run(run())
+            samples.append(timer() - start)
+        suite.record(f"build.end_to_end.concurrency_{concurrency}", samples, operations=concurrency)
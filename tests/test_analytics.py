@@ -0,0 +1,145 @@
+# pylint: disable=redefined-outer-name
+import asyncio
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+import pytest
+
+from wbld.build.analytics import BuildAnalytics
+from wbld.build.enums import Kind, State
+from wbld.build.models import BuildModel
+from wbld.cogs.wbld import WbldCog
+
+SHA1 = "5d6b97a63e4357f09f561f06355b2965be52ace7"
+ALICE = {"id": "42", "name": "Alice", "avatar_url": "https://example.com/a.png", "discriminator": "0001"}
+BOB = {"id": "43", "name": "Bob", "avatar_url": "https://example.com/b.png", "discriminator": "0002"}
+
+
+def create(env, state, duration=None, author=ALICE, platform="espressif8266@2.6.2", compiled=None, cached=None):
+    build = BuildModel(
+        env=env,
+        kind=Kind.BUILTIN,
+        sha1=SHA1,
+        state=state,
+        version="main",
+        duration=duration,
+        author=author,
+        platform=platform,
+        objects_compiled=compiled,
+        objects_cached=cached,
+    )
+    build.write()
+    return build
+
+
+@pytest.fixture
+def builds():
+    return [
+        create("d1_mini", State.SUCCESS, 100.0, compiled=10, cached=30),
+        create("d1_mini", State.SUCCESS, 120.0, compiled=40, cached=0),
+        create("d1_mini", State.SUCCESS, 300.0, author=BOB),
+        create("d1_mini", State.FAILED, 50.0),
+        create("esp32dev", State.SUCCESS, 400.0, platform="espressif32@3.5.0"),
+        create("esp32dev", State.CANCELLED, 10.0, platform="espressif32@3.5.0"),
+        create("esp01", State.BUILDING),
+    ]
+
+
+def test_summary(builds):  # pylint: disable=unused-argument
+    summary = BuildAnalytics.summary()
+
+    assert summary["builds"] == 6
+    assert summary["failure_rate"] == 1 / 5
+    assert summary["cache_hit_rate"] == 30 / 80
+    assert summary["duration"]["p50"] == 300.0
+    assert [env["name"] for env in summary["envs"]] == ["d1_mini", "esp32dev"]
+    assert summary["envs"][0]["duration"] == {"p50": 120.0, "p90": 300.0, "p95": 300.0}
+    assert summary["envs"][0]["failure_rate"] == 1 / 4
+    assert summary["platforms"][1] == {**summary["envs"][1], "name": "espressif32@3.5.0"}
+    assert [(requester["name"], requester["builds"]) for requester in summary["requesters"]] == [
+        ("Alice", 5),
+        ("Bob", 1),
+    ]
+    assert sum(summary["hours"]) == 6
+
+
+def test_incremental(builds):
+    BuildAnalytics.refresh()
+    assert BuildAnalytics.envs["d1_mini"].builds == 4
+
+    builds[3].state = State.SUCCESS
+    builds[-1].duration = 60.0
+    builds[-1].state = State.SUCCESS
+    summary = BuildAnalytics.summary()
+
+    assert summary["builds"] == 7
+    assert summary["failed"] == 0
+    assert BuildAnalytics.envs["d1_mini"].durations == [50.0, 100.0, 120.0, 300.0]
+    assert BuildAnalytics.envs["esp01"].durations == [60.0]
+
+
+def test_estimate(builds):
+    BuildAnalytics.refresh()
+
+    assert BuildAnalytics.estimate("d1_mini") == 120.0
+    # Not enough builds of esp32dev or its platform, so the median of all builds.
+    assert BuildAnalytics.estimate("esp32dev", "espressif32@3.5.0") == 300.0
+    assert BuildAnalytics.estimate("new_env", "espressif8266@2.6.2") == 120.0
+
+
+def test_env_summary(builds):  # pylint: disable=unused-argument
+    envs = {env.pop("name"): env for env in BuildAnalytics.summary()["envs"]}
+
+    assert BuildAnalytics.env_summary("d1_mini") == envs["d1_mini"]
+    assert BuildAnalytics.env_summary("esp01") is None
+    assert BuildAnalytics.env_summary("new_env") is None
+
+
+def test_estimate_without_history():
+    assert BuildAnalytics.estimate("d1_mini") is None
+    assert BuildAnalytics.remaining(None, 30.0) is None
+    assert BuildAnalytics.remaining(None, 30.0, fraction=0.25) == 90.0
+    assert BuildAnalytics.remaining(120.0, 30.0, fraction=0.25) == 90.0
+    assert BuildAnalytics.remaining(120.0, 200.0) == 0.0
+
+
+def test_stats_page(builds):  # pylint: disable=unused-argument
+    from wbld import web  # pylint: disable=import-outside-toplevel
+
+    async def run():
+        async with TestServer(web.create_app()) as server, ClientSession() as session:
+            async with session.get(server.make_url("/stats")) as page, session.get(
+                server.make_url("/api/stats?limit=1")
+            ) as api:
+                return await page.text(), await api.json()
+
+    web.pages.clear()
+    page, api = asyncio.run(run())
+
+    assert "d1_mini" in page
+    assert "espressif32@3.5.0" in page
+    assert [env["name"] for env in api["envs"]] == ["d1_mini"]
+    assert api["builds"] == 6
+
+
+def test_stats_command(builds, monkeypatch):  # pylint: disable=unused-argument
+    class Context:
+        def __init__(self):
+            self.messages = []
+
+        async def send(self, message):
+            self.messages.append(message)
+
+    async def stats(env):
+        ctx = Context()
+        await WbldCog.stats.callback(WbldCog(None, "https://wbld.app", "main"), ctx, env)
+        return ctx.messages
+
+    overall = asyncio.run(stats(None))
+    assert "`d1_mini`" in overall[0]
+    assert "Alice (5)" in overall[0]
+
+    # An env only needs its own aggregate.
+    monkeypatch.setattr(BuildAnalytics, "summary", None)
+    assert asyncio.run(stats("esp32dev"))[0].startswith("`esp32dev`")
+    assert asyncio.run(stats("esp01")) == ["No finished builds of `esp01` yet."]
@@ -0,0 +1,133 @@
+# pylint: disable=redefined-outer-name
+import asyncio
+import shutil
+
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+import pytest
+
+from wbld.api import routes
+from wbld.build.enums import Kind, State
+from wbld.build.index import BuildIndex
+from wbld.build.models import BuildModel
+
+SHA1 = "5d6b97a63e4357f09f561f06355b2965be52ace7"
+AUTHOR = {"id": "42", "name": "Alice", "avatar_url": "https://example.com/a.png", "discriminator": "0001"}
+
+
+@pytest.fixture
+def builds():
+    created = []
+    for index, (env, state) in enumerate(
+        [
+            ("d1_mini", State.SUCCESS),
+            ("esp32dev", State.FAILED),
+            ("d1_mini", State.BUILDING),
+            ("d1_mini", State.SUCCESS),
+        ]
+    ):
+        build = BuildModel(env=env, kind=Kind.BUILTIN, sha1=SHA1, state=state, version="main")
+        if index == 0:
+            build.author = AUTHOR
+        build.write()
+        created.append(build)
+    return created
+
+
+def request(path, headers=None):
+    async def run():
+        app = web.Application()
+        app.add_routes(routes)
+        async with TestServer(app) as server, ClientSession() as session:
+            async with session.get(server.make_url(path), headers=headers or {}) as response:
+                body = await response.json() if response.status == 200 else await response.text()
+                return response.status, response.headers, body
+
+    return asyncio.run(run())
+
+
+def test_list_builds(builds):
+    status, headers, body = request("/api/builds")
+
+    assert status == 200
+    assert len(body["builds"]) == len(builds)
+    assert body["cursor"] is None
+    assert headers["ETag"]
+    assert headers["Last-Modified"]
+
+
+def test_filters(builds):
+    _, _, body = request("/api/builds?env=d1_mini&state=success")
+    assert {build["id"] for build in body["builds"]} == {builds[0].build_id, builds[3].build_id}
+
+    _, _, body = request("/api/builds?author=alice")
+    assert [build["id"] for build in body["builds"]] == [builds[0].build_id]
+    assert body["builds"][0]["state"] == "success"
+    assert body["builds"][0]["links"]["firmware"]
+
+    status, _, text = request("/api/builds?state=bogus")
+    assert status == 400
+    assert "success" in text
+
+
+def test_pagination(builds):
+    seen = []
+    path = "/api/builds?limit=3"
+    while path:
+        status, _, body = request(path)
+        assert status == 200
+        seen.extend(build["id"] for build in body["builds"])
+        path = body["next"]
+
+    assert seen == [build.build_id for build in reversed(builds)]
+    assert request("/api/builds?cursor=nonsense")[0] == 400
+
+
+def test_conditional_get(builds):
+    status, headers, _ = request(f"/api/builds/{builds[2].build_id}")
+    assert status == 200
+
+    status, _, _ = request(f"/api/builds/{builds[2].build_id}", {"If-None-Match": headers["ETag"]})
+    assert status == 304
+    status, _, _ = request(f"/api/builds/{builds[2].build_id}", {"If-Modified-Since": headers["Last-Modified"]})
+    assert status == 304
+
+    builds[2].state = State.SUCCESS
+    status, _, body = request(f"/api/builds/{builds[2].build_id}", {"If-None-Match": headers["ETag"]})
+    assert status == 200
+    assert body["state"] == "success"
+
+
+def test_list_etag_changes(builds):
+    _, headers, _ = request("/api/builds")
+    assert request("/api/builds", {"If-None-Match": headers["ETag"]})[0] == 304
+
+    builds[1].reason = "Exit code 1"
+    assert request("/api/builds", {"If-None-Match": headers["ETag"]})[0] == 200
+
+
+def test_missing_build(builds):  # pylint: disable=unused-argument
+    assert request("/api/builds/doesnotexist")[0] == 404
+    assert request("/api/builds/..")[0] == 404
+
+
+def test_index_drops_removed_builds(builds, monkeypatch):
+    entries, _ = BuildIndex.query(limit=None)
+    assert len(entries) == len(builds)
+
+    # Removed by another process, so only a full scan notices.
+    monkeypatch.setattr(BuildIndex, "refresh_interval", 0)
+    shutil.rmtree(builds[0].path)
+    entries, _ = BuildIndex.query(limit=None)
+    assert builds[0].build_id not in [entry.build_id for entry in entries]
+
+
+def test_index_picks_up_writes_in_process(builds):
+    BuildIndex.query(limit=None)
+    generation = BuildIndex.generation
+
+    builds[1].state = State.CANCELLED
+    entries, _ = BuildIndex.query(state=State.CANCELLED)
+
+    assert [entry.build_id for entry in entries] == [builds[1].build_id]
+    assert BuildIndex.generation != generation
@@ -1,9 +1,20 @@
+import asyncio
+
 import pytest
 
 from wbld.bot import Bot
 from wbld.cogs.health import Health
 
 
+@pytest.fixture(autouse=True)
+def event_loop():
+    # discord.py grabs the current event loop on construction, other tests may have closed it with asyncio.run().
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+
+
 def test_clone_init():
     bot = Bot(command_prefix="fake_prefix")
 
@@ -6,7 +6,7 @@ from pydantic.error_wrappers import ValidationError
 import pytest
 
 from wbld.build.config import CustomConfig
-from wbld.build.models import BuildModel
+from wbld.build.models import BuildModel, BuildRecord
 from wbld.build.enums import Kind, State
 from wbld.build import Build, Builder, BuilderCustom
 from wbld.repository import Clone
@@ -134,6 +134,39 @@ def test_good_uuid(good_uuid):  # pylint: disable=redefined-outer-name
     assert build.state == State.SUCCESS  # pylint: disable=no-member
 
 
+def test_path_is_derived_from_location(good_uuid, tmp_path):  # pylint: disable=redefined-outer-name
+    moved = tmp_path.joinpath(good_uuid.name)
+    good_uuid.rename(moved)
+
+    build = BuildModel.parse_build_path(moved)
+    assert build.path == moved
+
+    build.reason = "Moved"
+    assert '"path"' not in moved.joinpath(BuildModel.build_file).read_text()
+
+
+def test_record(good_uuid):  # pylint: disable=redefined-outer-name
+    record = BuildRecord.load(good_uuid)
+    model = Build(good_uuid.name)
+
+    assert record.build_id == model.build_id == good_uuid.name
+    assert record.path == good_uuid
+    assert record.kind == Kind.BUILTIN
+    assert record.state == State.SUCCESS
+    assert record.finished
+    assert record.env == model.env
+    assert record.model() == model
+
+
+def test_record_invalid(storage_dir):  # pylint: disable=redefined-outer-name
+    path = storage_dir.joinpath("f5J7V4PU6vQuaLCKdQJwkz")
+    path.mkdir()
+    path.joinpath(BuildModel.build_file).write_text('{"kind": 1}')
+
+    with pytest.raises(ValueError):
+        BuildRecord.load(path)
+
+
 def test_custom_builder(temp_clone_with_override, custom_config_snippet_esp):  # pylint: disable=redefined-outer-name
     custom_builder = BuilderCustom(temp_clone_with_override, custom_config_snippet_esp)
     assert isinstance(custom_builder, BuilderCustom)
@@ -0,0 +1,103 @@
+# pylint: disable=redefined-outer-name
+import os
+
+import pytest
+
+from wbld import cache
+
+
+@pytest.fixture
+def source(tmp_path):
+    roots = {"platformio": tmp_path.joinpath("source/platformio"), "buildcache": tmp_path.joinpath("source/cache")}
+    toolchain = roots["platformio"].joinpath("packages/toolchain-xtensa/bin")
+    toolchain.mkdir(parents=True)
+    toolchain.joinpath("xtensa-gcc").write_text("#!/bin/sh\n")
+    toolchain.joinpath("xtensa-gcc").chmod(0o755)
+    toolchain.joinpath("gcc").symlink_to("xtensa-gcc")
+    roots["platformio"].joinpath(".cache/tmp").mkdir(parents=True)
+    roots["platformio"].joinpath(".cache/tmp/download").write_text("partial")
+    roots["platformio"].joinpath("appstate.json").write_text("{}")
+    roots["buildcache"].mkdir()
+    roots["buildcache"].joinpath("object.o").write_bytes(b"\0" * 128)
+    return roots
+
+
+@pytest.fixture
+def target(tmp_path):
+    return {"platformio": tmp_path.joinpath("target/platformio"), "buildcache": tmp_path.joinpath("target/cache")}
+
+
+def test_export_import(tmp_path, source, target):
+    archive = tmp_path.joinpath("snapshot.tar.gz")
+    manifest = cache.export(archive, roots=source)
+
+    assert sorted(manifest["files"]) == [
+        "buildcache/object.o",
+        "platformio/packages/toolchain-xtensa/bin/gcc",
+        "platformio/packages/toolchain-xtensa/bin/xtensa-gcc",
+    ]
+    assert tmp_path.joinpath("snapshot.tar.gz.sha256").read_text().split()[0] == cache.checksum(archive)
+
+    cache.import_archive(archive, roots=target)
+
+    binary = target["platformio"].joinpath("packages/toolchain-xtensa/bin/xtensa-gcc")
+    assert binary.read_text() == "#!/bin/sh\n"
+    assert os.access(binary, os.X_OK)
+    assert os.readlink(binary.parent.joinpath("gcc")) == "xtensa-gcc"
+    assert target["buildcache"].joinpath("object.o").stat().st_size == 128
+    assert not target["platformio"].joinpath("appstate.json").exists()
+    assert cache.installed(target) == manifest["id"]
+    assert cache.scan(target).keys() == cache.scan(source).keys()
+
+
+def test_delta(tmp_path, source, target):
+    snapshot, delta = tmp_path.joinpath("snapshot.tar.gz"), tmp_path.joinpath("delta.tar.gz")
+    cache.export(snapshot, roots=source)
+    source["buildcache"].joinpath("object.o").unlink()
+    source["buildcache"].joinpath("other.o").write_text("other")
+
+    manifest = cache.export(delta, base=snapshot, roots=source)
+
+    assert manifest["files"] == ["buildcache/other.o"]
+    assert manifest["deleted"] == ["buildcache/object.o"]
+
+    with pytest.raises(cache.CacheError, match="delta of snapshot"):
+        cache.import_archive(delta, roots=target)
+
+    cache.import_archive(snapshot, roots=target)
+    cache.import_archive(delta, roots=target)
+
+    assert sorted(path.name for path in target["buildcache"].iterdir()) == ["other.o"]
+    assert cache.installed(target) == manifest["id"]
+
+
+def test_import_corrupt(tmp_path, source, target):
+    archive = tmp_path.joinpath("snapshot.tar.gz")
+    cache.export(archive, roots=source)
+    with archive.open("ab") as file:
+        file.write(b"garbage")
+
+    with pytest.raises(cache.CacheError, match="Checksum mismatch"):
+        cache.import_archive(archive, roots=target)
+    assert not target["platformio"].exists()
+
+
+def test_import_other_host(tmp_path, source, target, monkeypatch):
+    archive = tmp_path.joinpath("snapshot.tar.gz")
+    cache.export(archive, roots=source)
+    monkeypatch.setattr(cache, "host", lambda: {"platform": "darwin", "machine": "arm64"})
+
+    with pytest.raises(cache.CacheError, match="was made on"):
+        cache.import_archive(archive, roots=target)
+
+    cache.import_archive(archive, roots=target, force=True)
+    assert target["buildcache"].joinpath("object.o").exists()
+
+
+def test_main(tmp_path, source, monkeypatch):
+    monkeypatch.setenv("PLATFORMIO_CORE_DIR", str(source["platformio"]))
+    monkeypatch.setenv("PLATFORMIO_BUILD_CACHE_DIR", str(source["buildcache"]))
+    archive = tmp_path.joinpath("snapshot.tar.gz")
+
+    assert cache.main(["export", str(archive)]) == 0
+    assert cache.main(["import", str(tmp_path.joinpath("missing.tar.gz"))]) == 1
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+from aiohttp import web
+
+from wbld.diagnostics import LoopMonitor, monitor, routes
+
+
+def block():
+    time.sleep(0.3)
+
+
+def test_stall_is_captured():
+    async def run():
+        loop_monitor = LoopMonitor(interval=0.02, threshold=0.1)
+        loop_monitor.start()
+        await asyncio.sleep(0.1)
+        block()
+        await asyncio.sleep(0.1)
+        loop_monitor.stop()
+        return loop_monitor
+
+    loop_monitor = asyncio.run(run())
+    snapshot = loop_monitor.snapshot()
+
+    assert snapshot["lag"]["max"] >= 0.2
+    assert len(snapshot["recent"]) == 1
+    stall = snapshot["recent"][0]
+    assert stall["location"].startswith("tests/test_diagnostics.py:")
+    assert stall["location"].endswith(" block")
+    assert stall["blocked"] >= 0.2
+    assert 'wbld_loop_stalls_total{location="tests/test_diagnostics.py:' in loop_monitor.metrics()
+
+
+def test_no_stall_without_blocking():
+    async def run():
+        loop_monitor = LoopMonitor(interval=0.02, threshold=0.1)
+        loop_monitor.start()
+        await asyncio.sleep(0.2)
+        loop_monitor.stop()
+        return loop_monitor
+
+    loop_monitor = asyncio.run(run())
+
+    assert not loop_monitor.stalls
+    assert loop_monitor.lag_count > 0
+
+
+def test_endpoints():
+    async def run():
+        app = web.Application()
+        app.add_routes(routes)
+        async with TestServer(app) as server, ClientSession() as session:
+            async with session.get(server.make_url("/debug/loop")) as response:
+                snapshot = await response.json()
+            async with session.get(server.make_url("/debug/metrics")) as response:
+                metrics = await response.text()
+        return snapshot, metrics
+
+    snapshot, metrics = asyncio.run(run())
+
+    assert snapshot["threshold"] == monitor.threshold
+    assert "wbld_loop_lag_seconds_count" in metrics
@@ -0,0 +1,42 @@
+import os
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+BUDGET_MS = int(os.getenv("IMPORT_BUDGET_MS", "1500"))
+
+
+def import_times(module, storage_dir):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env={**os.environ, "STORAGE_DIR": str(storage_dir)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+@pytest.mark.parametrize(
+    "module,heavy",
+    [
+        ("wbld.web", ["platformio", "github", "git", "discord"]),
+        ("wbld.bot", ["platformio", "github", "git"]),
+        ("wbld.worker", ["platformio", "github", "git", "discord"]),
+    ],
+)
+def test_import_time(module, heavy, storage_dir):
+    times = import_times(module, storage_dir)
+
+    assert not [name for name in heavy if name in times]
+    assert times[module] < BUDGET_MS
@@ -0,0 +1,117 @@
+import asyncio
+import sqlite3
+from time import monotonic
+
+import pytest
+
+from wbld.build.enums import Kind
+from wbld.build.journal import Journal, JobState
+from wbld.build.storage import Storage
+from wbld.cogs.wbld import WbldCog
+
+
+@pytest.fixture
+def job():
+    return Journal.enqueue(
+        kind=Kind.BUILTIN, version="main", payload="d1_mini", channel_id=1, message_id=2, author_id=3
+    )
+
+
+def test_enqueue(job):  # pylint: disable=redefined-outer-name
+    stored = Journal.get(job.id)
+
+    assert stored == job
+    assert stored.state == JobState.QUEUED
+    assert Journal.unfinished() == [job]
+
+
+def test_start_and_finish(job):  # pylint: disable=redefined-outer-name
+    Journal.start(job.id, "f5J7V4PU6vQuaLCKdQJwkz")
+    started = Journal.get(job.id)
+
+    assert started.state == JobState.RUNNING
+    assert started.build_id == "f5J7V4PU6vQuaLCKdQJwkz"
+    assert started.attempts == 1
+
+    Journal.finish(job.id)
+
+    assert Journal.get(job.id).state == JobState.DONE
+    assert not Journal.unfinished()
+
+
+def test_track_finishes_on_error(job):  # pylint: disable=redefined-outer-name
+    with pytest.raises(ValueError):
+        with Journal.track(job):
+            raise ValueError
+
+    assert Journal.get(job.id).state == JobState.DONE
+
+
+def test_track_keeps_cancelled_jobs(job):  # pylint: disable=redefined-outer-name
+    with pytest.raises(KeyboardInterrupt):
+        with Journal.track(job):
+            raise KeyboardInterrupt
+
+    assert Journal.unfinished() == [job]
+
+
+def test_get_missing():
+    with pytest.raises(KeyError):
+        Journal.get("missing")
+
+
+def test_failed_resume_finishes_job(job):  # pylint: disable=redefined-outer-name
+    async def resume(_):
+        raise RuntimeError("no channel")
+
+    async def ready():
+        cog = WbldCog(None, "", "main")
+        cog._resume = resume  # pylint: disable=protected-access
+        await cog.on_ready()
+
+    asyncio.run(ready())
+
+    assert not Journal.unfinished()
+    assert Journal.get(job.id).error == "no channel"
+
+
+def test_migrate_old_journal():
+    connection = sqlite3.connect(Storage.base_path.joinpath(Journal.filename))
+    connection.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, state TEXT NOT NULL, kind INTEGER NOT NULL, version TEXT NOT NULL, "
+        "payload TEXT NOT NULL, channel_id INTEGER NOT NULL, message_id INTEGER NOT NULL, author_id INTEGER NOT NULL, "
+        "build_id TEXT, attempts INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, updated REAL NOT NULL)"
+    )
+    connection.execute("INSERT INTO jobs VALUES ('old', 'queued', 1, 'main', 'd1_mini', 1, 2, 3, NULL, 0, 0, 0)")
+    connection.commit()
+    connection.close()
+
+    job = Journal.enqueue(
+        kind=Kind.BUILTIN, version="main", payload="d1_mini", channel_id=1, message_id=2, author_id=3, remote=True
+    )
+    Journal.finish(job.id, error="failed")
+
+    assert Journal.get("old").remote is False
+    assert Journal.get(job.id).error == "failed"
+    with Journal.connect() as connection:
+        assert connection.execute("PRAGMA user_version").fetchone()[0] == len(Journal.migrations)
+
+
+def test_busy_journal_fails_fast(job, monkeypatch):  # pylint: disable=redefined-outer-name
+    monkeypatch.setattr(Journal, "busy_timeout", 0.1)
+    monkeypatch.setattr(Journal, "_connection", None)
+    assert Journal._open() is Journal._open()  # pylint: disable=protected-access
+
+    other = sqlite3.connect(Storage.base_path.joinpath(Journal.filename), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    started = monotonic()
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            Journal.finish(job.id)
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+
+    assert monotonic() - started < 5
+    Journal.finish(job.id)
+    assert not Journal.unfinished()
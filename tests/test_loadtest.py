@@ -0,0 +1,38 @@
+import asyncio
+import random
+
+from benchmarks.loadtest import Distribution, Simulation
+from wbld.build import Manager
+from wbld.build.journal import Journal
+from wbld.status import StatusUpdater
+
+
+def test_distribution():
+    assert Distribution("fixed:2", random.Random()).sample() == 2
+    assert Distribution("normal:-10,0", random.Random()).sample() == 0
+
+
+def test_simulation():
+    simulation = Simulation(
+        users=4,
+        commands=2,
+        ramp=0.1,
+        channels=2,
+        custom_ratio=0.5,
+        failure_rate=0,
+        duration="fixed:0.05",
+        clone="fixed:0",
+        latency="fixed:0.001",
+        typing="fixed:0",
+        think="fixed:0",
+        status=StatusUpdater(rate=100, per=1),
+    )
+    report = asyncio.run(simulation.run())
+
+    assert report["requests"] == 8
+    assert report["errors"] == 0
+    assert report["custom"] > 0
+    assert report["queue_wait"]["max"] >= 0
+    assert report["edits"] > 0
+    assert len(list(Manager.list_builds())) == 8
+    assert not Journal.unfinished()
@@ -0,0 +1,124 @@
+# pylint: disable=redefined-outer-name
+import asyncio
+import time
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+import pytest
+
+from wbld.build.enums import Kind, State
+from wbld.build.models import BuildModel
+from wbld.pages import IMMUTABLE, PageCache
+
+SHA1 = "5d6b97a63e4357f09f561f06355b2965be52ace7"
+
+
+@pytest.fixture
+def web():
+    # The web module reads the storage directory on import, which is only set once the storage fixture ran.
+    from wbld import web  # pylint: disable=import-outside-toplevel
+
+    web.pages.clear()
+    return web
+
+
+@pytest.fixture
+def build():
+    build = BuildModel(env="d1_mini", kind=Kind.BUILTIN, sha1=SHA1, state=State.BUILDING, version="main")
+    build.write()
+    return build
+
+
+def fetch(web, *requests):
+    async def run():
+        responses = []
+        async with TestServer(web.create_app()) as server, ClientSession() as session:
+            for path, headers in requests:
+                async with session.get(server.make_url(path), headers=headers) as response:
+                    responses.append((response.status, response.headers, await response.text()))
+        return responses
+
+    return asyncio.run(run())
+
+
+def test_build_list_is_cached(web, build):
+    (_, headers, body), (status, _, _) = fetch(web, ("/", {}), ("/", {}))
+    assert build.build_id in body
+    assert status == 200
+
+    etag = headers["ETag"]
+    ((status, _, _),) = fetch(web, ("/", {"If-None-Match": etag}))
+    assert status == 304
+
+    build.state = State.SUCCESS
+    ((status, headers, _),) = fetch(web, ("/", {"If-None-Match": etag}))
+    assert status == 200
+    assert headers["ETag"] != etag
+
+
+def test_build_page_follows_state(web, build, monkeypatch):
+    monkeypatch.setattr(web, "API_TOKEN", "secret")
+    ((_, headers, body),) = fetch(web, (f"/build/{build.build_id}", {}))
+    assert headers["Cache-Control"] == "no-cache"
+    assert "Cancel build" in body
+
+    build.state = State.SUCCESS
+    ((_, headers, body),) = fetch(web, (f"/build/{build.build_id}", {}))
+    assert headers["Cache-Control"] == "no-cache"
+    assert "Cancel build" not in body
+
+    build.sealed = True
+    ((_, headers, _),) = fetch(web, (f"/build/{build.build_id}", {}))
+    assert headers["Cache-Control"] == IMMUTABLE
+
+    ((status, _, _),) = fetch(web, ("/build/doesnotexist", {}))
+    assert status == 404
+
+
+def test_cancel_requires_token(web, build, monkeypatch):
+    async def cancel(token):
+        async with TestServer(web.create_app()) as server, ClientSession() as session:
+            url = server.make_url(f"/build/{build.build_id}/cancel")
+            async with session.post(url, data={"token": token}, allow_redirects=False) as response:
+                return response.status
+
+    assert asyncio.run(cancel("")) == 403
+    assert "Cancel build" not in fetch(web, (f"/build/{build.build_id}", {}))[0][2]
+
+    monkeypatch.setattr(web, "API_TOKEN", "secret")
+    assert asyncio.run(cancel("wrong")) == 403
+    assert not build.file_cancel.exists()
+    assert asyncio.run(cancel("secret")) == 303
+    assert build.file_cancel.exists()
+
+
+def test_data_serves_only_build_files(web, build, storage_dir):
+    build.file_log.write_text("log")
+    storage_dir.joinpath("journal.sqlite3").write_text("jobs")
+
+    (status, _, body), (journal, _, _), (traversal, _, _) = fetch(
+        web,
+        (f"/data/{build.build_id}/combined.txt", {}),
+        ("/data/journal.sqlite3", {}),
+        (f"/data/{build.build_id}/..%2Fjournal.sqlite3", {}),
+    )
+
+    assert (status, body) == (200, "log")
+    assert journal == 404
+    assert traversal == 404
+
+
+def test_page_cache_expiry():
+    cache = PageCache(size=2)
+    cache.put("/a", 1, "a", 0)
+    cache.put("/b", 1, "b", 0, ttl=0.01)
+
+    assert cache.get("/a", 1).body == b"a"
+    assert cache.get("/a", 2) is None
+    time.sleep(0.02)
+    assert cache.get("/b", 1) is None
+
+    for key in ("/c", "/d", "/e"):
+        cache.put(key, 1, key, 0)
+    assert cache.get("/c", 1) is None
+    assert cache.get("/e", 1).body == b"/e"
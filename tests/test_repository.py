@@ -1,5 +1,11 @@
+# pylint: disable=redefined-outer-name
+import subprocess
+from types import SimpleNamespace
+
+from git import GitCommandError
 import pytest
 
+from wbld.build.enums import State
 from wbld.repository import Clone
 
 
@@ -14,3 +20,91 @@ def test_clone_init():
 def test_clone_requires_version():
     with pytest.raises(TypeError):
         Clone()  # pylint: disable=no-value-for-parameter
+
+
+@pytest.fixture
+def origin(tmp_path):
+    work = tmp_path.joinpath("work")
+    for name in ("wled00/wled.cpp", "usermods/readme.md", "tools/cdata.js", "images/logo.png"):
+        work.joinpath(name).parent.mkdir(parents=True, exist_ok=True)
+        work.joinpath(name).write_text(name)
+    work.joinpath("platformio.ini").write_text("[env]\nextra_scripts = pre:tools/cdata.js\n")
+    for args in (
+        ["init", "-q", "-b", "main"],
+        ["add", "-A"],
+        ["-c", "user.name=wbld", "-c", "user.email=wbld@wbld.app", "commit", "-q", "-m", "Initial"],
+    ):
+        subprocess.run(["git", "-C", str(work), *args], check=True)
+
+    bare = tmp_path.joinpath("WLED.git")
+    subprocess.run(["git", "clone", "-q", "--bare", str(work), str(bare)], check=True)
+    subprocess.run(["git", "-C", str(bare), "config", "uploadpack.allowFilter", "true"], check=True)
+    return bare.as_uri()
+
+
+def test_clone_full(origin):
+    clone = Clone("main", url=origin, sparse=False)
+    with clone as path:
+        clone.clone_version()
+        assert path.joinpath("images/logo.png").exists()
+
+    assert not path.exists()
+
+
+def test_clone_sparse(origin):
+    clone = Clone("main", url=origin, sparse=True)
+    sha1 = clone.clone_version()
+
+    assert str(sha1) == clone.repo.git.rev_parse("origin/main")
+    assert clone.path.joinpath("platformio.ini").exists()
+    assert clone.path.joinpath("wled00/wled.cpp").exists()
+    assert clone.path.joinpath("tools/cdata.js").exists()
+    assert not clone.path.joinpath("images").exists()
+    assert clone.missing_paths() == []
+    clone.cleanup()
+
+
+def test_clone_sparse_expand(origin):
+    clone = Clone("main", url=origin, sparse=True)
+    clone.clone_version()
+    clone.path.joinpath("platformio_override.ini").write_text(
+        "[env:custom]\nboard_build.partitions = images/logo.png\n"
+    )
+    build = SimpleNamespace(state=State.FAILED, failure=None, reason=None)
+
+    assert clone.missing_paths() == ["images/logo.png"]
+    assert clone.needs_full_checkout(build)
+    assert not clone.needs_full_checkout(SimpleNamespace(state=State.FAILED, failure=None, reason="Timed out"))
+
+    clone.expand()
+
+    assert clone.path.joinpath("images/logo.png").read_text() == "images/logo.png"
+    assert not clone.needs_full_checkout(build)
+    clone.cleanup()
+
+
+def test_clone_sparse_missing_files(origin):
+    clone = Clone("main", url=origin, sparse=True)
+    clone.clone_version()
+
+    def failed(*missing):
+        return SimpleNamespace(state=State.FAILED, reason=None, failure=SimpleNamespace(missing=list(missing)))
+
+    assert clone.missing_files(["logo.png", "FastLED.h", "wled.cpp"]) == ["logo.png"]
+    assert clone.needs_full_checkout(failed("images/logo.png"))
+    # Headers of libraries and unknown packages aren't in the tree.
+    assert not clone.needs_full_checkout(failed("FastLED.h", "Error: Unknown board ID 'd1_mini_typo'"))
+    clone.cleanup()
+
+
+def test_clone_sparse_fallback(origin, monkeypatch):
+    def unsupported(self):
+        raise GitCommandError("sparse-checkout", 1)
+
+    monkeypatch.setattr(Clone, "_clone_sparse", unsupported)
+    clone = Clone("main", url=origin, sparse=True)
+    clone.clone_version()
+
+    assert not clone.sparse
+    assert clone.path.joinpath("images/logo.png").exists()
+    clone.cleanup()
@@ -0,0 +1,148 @@
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import time
+
+import pytest
+
+from wbld.build import Manager
+from wbld.build.enums import Kind, State
+from wbld.build.models import BuildModel
+from wbld.build.runner import Runner
+
+
+class FakeBuilder:
+    def __init__(self, sleep=0.0, state=State.SUCCESS):
+        self.build = BuildModel(
+            kind=Kind.BUILTIN, env="fake_env", version="master", sha1="5d6b97a63e4357f09f561f06355b2965be52ace7"
+        )
+        self.sleep = sleep
+        self.state = state
+
+    def run(self):
+        self.build.state = State.BUILDING
+        time.sleep(self.sleep)
+        self.build.state = self.state
+        return self.build
+
+
+@pytest.fixture(autouse=True)
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(Runner, "poll_interval", 0.05)
+
+
+def test_runner_success():
+    builder = FakeBuilder()
+    started = []
+    build = asyncio.run(Runner(builder, started=started.append).run())
+
+    assert build.state == State.SUCCESS
+    assert build.reason is None
+    assert build.jobs >= 1
+    assert builder.build is build
+    assert not Runner.running
+    assert len(started) == 1
+
+
+def test_runner_timeout(monkeypatch):
+    monkeypatch.setattr(Runner, "timeout", 0.2)
+    build = asyncio.run(Runner(FakeBuilder(sleep=30)).run())
+
+    assert build.state == State.FAILED
+    assert build.reason.startswith("Timed out")
+    assert BuildModel.parse_build_path(build.path).state == State.FAILED
+    assert BuildModel.parse_build_path(build.path).sealed
+
+
+def test_runner_cancel():
+    builder = FakeBuilder(sleep=30)
+
+    async def cancel_soon():
+        await asyncio.sleep(0.2)
+        Manager.cancel_build(builder.build.build_id, reason="Cancelled by test")
+
+    async def main():
+        _, build = await asyncio.gather(cancel_soon(), Runner(builder).run())
+        return build
+
+    build = asyncio.run(main())
+
+    assert build.state == State.CANCELLED
+    assert build.reason == "Cancelled by test"
+
+
+def test_runner_cancel_kills_directly(monkeypatch):
+    monkeypatch.setattr(Runner, "poll_interval", 0.5)
+    builder = FakeBuilder(sleep=30)
+
+    async def main():
+        runner = asyncio.ensure_future(Runner(builder).run())
+        await asyncio.sleep(0.2)
+        Manager.cancel_build(builder.build.build_id, reason="Cancelled by test")
+        assert Runner.cancel(builder.build.build_id)
+        return await runner
+
+    build = asyncio.run(main())
+
+    assert build.state == State.CANCELLED
+    assert build.reason == "Cancelled by test"
+    assert not Runner.cancel(build.build_id)
+
+
+def test_runner_retries_sparse_checkout():
+    builder = FakeBuilder(state=State.FAILED)
+
+    class FakeClone:
+        sparse = True
+
+        def needs_full_checkout(self, build):
+            return self.sparse and build.state == State.FAILED
+
+        def expand(self):
+            self.sparse = False
+            builder.state = State.SUCCESS
+
+    builder.clone = FakeClone()
+    build = asyncio.run(Runner(builder).run())
+
+    assert build.state == State.SUCCESS
+    assert build.reason is None
+    assert not builder.clone.sparse
+
+
+def test_runner_counts_objects():
+    class LoggingBuilder(FakeBuilder):
+        def run(self):
+            self.build.file_log.write_text("Compiling a.o\nRetrieved `b.o' from cache\nCompiling c.o\n")
+            return super().run()
+
+    seen = []
+    build = asyncio.run(Runner(LoggingBuilder(), progress=lambda built, expected: seen.append(built)).run())
+
+    assert (build.objects_compiled, build.objects_cached) == (2, 1)
+    assert seen == [3]
+    assert Runner.compiled_objects["fake_env"] == 3
+
+
+def sleep_in_own_session():
+    os.setsid()
+    time.sleep(30)
+
+
+def test_kill_stale_build():
+    stale = multiprocessing.get_context("fork").Process(target=sleep_in_own_session)
+    stale.start()
+    time.sleep(0.1)
+    other = subprocess.Popen(["sleep", "30"], start_new_session=True)
+
+    try:
+        assert Runner.kill_stale(stale.pid)
+        stale.join(5)
+        assert stale.exitcode == -9
+        # Not forked from this process, so likely a reused process id.
+        assert not Runner.kill_stale(other.pid)
+        assert other.poll() is None
+    finally:
+        other.kill()
+        other.wait()
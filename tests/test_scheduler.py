@@ -0,0 +1,59 @@
+import pytest
+
+from wbld.build.scheduler import Scheduler
+
+
+@pytest.fixture(autouse=True)
+def host(monkeypatch):
+    monkeypatch.setattr(Scheduler, "active", {})
+    monkeypatch.setattr(Scheduler, "cpu_count", staticmethod(lambda: 32))
+    monkeypatch.setattr(Scheduler, "available_memory", staticmethod(lambda: 64 * 1024**3))
+    monkeypatch.setattr(Scheduler, "max_jobs", 0)
+    monkeypatch.setattr(Scheduler, "concurrency", 2)
+
+
+def test_idle_host_leaves_room_for_concurrent_builds(monkeypatch):
+    assert Scheduler.jobs() == 16
+
+    monkeypatch.setattr(Scheduler, "concurrency", 1)
+    assert Scheduler.jobs() == 32
+
+
+def test_share_shrinks_and_grows_with_active_builds():
+    assert Scheduler.acquire("first") == 16
+    assert Scheduler.acquire("second") == 16
+    # The CPUs are all handed out, later builds still make progress with one job each.
+    assert Scheduler.acquire("third") == 1
+
+    Scheduler.release("first")
+    Scheduler.release("third")
+
+    assert Scheduler.jobs() == 16
+
+
+def test_concurrent_builds_get_comparable_shares(monkeypatch):
+    monkeypatch.setattr(Scheduler, "concurrency", 4)
+
+    assert [Scheduler.acquire(name) for name in ("a", "b", "c", "d")] == [8, 8, 8, 8]
+
+
+def test_jobs_never_exceed_free_cpus():
+    Scheduler.active = {"running": 30}
+
+    assert Scheduler.jobs() == 2
+    Scheduler.active = {"running": 20}
+    assert Scheduler.jobs() == 12
+
+
+def test_memory_headroom_caps_jobs(monkeypatch):
+    monkeypatch.setattr(Scheduler, "available_memory", staticmethod(lambda: 3 * Scheduler.memory_per_job))
+
+    assert Scheduler.jobs() == 3
+    Scheduler.active = {"starting": 2}
+    assert Scheduler.jobs() == 1
+
+
+def test_at_least_one_job(monkeypatch):
+    monkeypatch.setattr(Scheduler, "available_memory", staticmethod(lambda: 0))
+
+    assert Scheduler.jobs() == 1
@@ -0,0 +1,69 @@
+import asyncio
+from itertools import count
+from time import monotonic
+
+from wbld.status import StatusUpdater
+
+ids = count()
+
+
+class FakeChannel:
+    def __init__(self):
+        self.id = next(ids)
+        self.edits = []
+
+    async def send(self, content, **kwargs):
+        return FakeMessage(self, content)
+
+
+class FakeMessage:
+    def __init__(self, channel, content):
+        self.id = next(ids)
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, **fields):
+        self.channel.edits.append((monotonic(), self.id, fields["content"]))
+        self.content = fields["content"]
+
+
+def test_updates_are_coalesced():
+    async def main():
+        updater = StatusUpdater(rate=1, per=0.2)
+        channel = FakeChannel()
+        first = await updater.create(channel, "queued")
+        second = await updater.create(channel, "queued")
+
+        for percent in range(10):
+            first.update(f"first {percent}%")
+            second.update(f"second {percent}%")
+        await updater.flush(channel.id)
+        return first, second, channel
+
+    first, second, channel = asyncio.run(main())
+
+    assert first.message.content == "first 9%"
+    assert second.message.content == "second 9%"
+    assert len(channel.edits) <= 4
+
+
+def test_edits_are_rate_limited_per_channel():
+    async def main():
+        updater = StatusUpdater(rate=2, per=0.2)
+        busy, quiet = FakeChannel(), FakeChannel()
+        statuses = [await updater.create(busy, "queued") for _ in range(3)]
+        other = await updater.create(quiet, "queued")
+
+        for status in statuses:
+            status.update("compiling")
+        other.update("compiling")
+        await asyncio.gather(updater.flush(busy.id), updater.flush(quiet.id))
+        return busy, quiet
+
+    busy, quiet = asyncio.run(main())
+    times = [edit[0] for edit in busy.edits]
+
+    assert len(busy.edits) == 3
+    assert len(quiet.edits) == 1
+    for earlier, later in zip(times, times[2:]):
+        assert later - earlier >= 0.19
@@ -0,0 +1,120 @@
+# pylint: disable=redefined-outer-name
+import pytest
+
+from wbld.build.enums import Kind, State
+from wbld.build.index import BuildIndex
+from wbld.build.models import BuildModel
+from wbld.build.triage import analyze, MAX_LINES
+from wbld.cogs.wbld import MESSAGE_LIMIT, WbldCog
+
+SHA1 = "5d6b97a63e4357f09f561f06355b2965be52ace7"
+
+LOG = """Processing {env} (board: d1_mini; platform: espressif8266@2.6.2; framework: arduino)
+--------------------------------------------------------------------------------
+Library Manager: Installing FastLED
+Compiling .pio/build/{env}/src/wled.cpp.o
+Compiling .pio/build/{env}/src/fx.cpp.o
+{root}/wled00/fx.cpp:142:5: error: 'strip' was not declared in this scope
+   strip.show();
+   ^~~~~
+{root}/wled00/wled.h:30:10: fatal error: FastLED.h: No such file or directory
+compilation terminated.
+*** [.pio/build/{env}/src/fx.cpp.o] Error 1
+Linking .pio/build/{env}/firmware.elf
+{root}/.pio/build/{env}/src/wled.cpp.o:(.text.setup+0x4): undefined reference to `WLED::instance()'
+collect2: error: ld returned 1 exit status
+=========================== [FAILED] Took 12.34 seconds ===========================
+
+Environment    Status    Duration
+-------------  --------  ------------
+{env}          FAILED    00:00:12.340
+===================== 1 failed, 0 succeeded in 00:00:12.340 =====================
+"""
+
+
+def failed_build(log: str, env="d1_mini") -> BuildModel:
+    build = BuildModel(env=env, kind=Kind.BUILTIN, sha1=SHA1, state=State.FAILED, version="main")
+    build.file_log.write_text(log)
+    build.failure = analyze(build.file_log)
+    return build
+
+
+@pytest.fixture
+def log():
+    return LOG.format(env="d1_mini", root="/tmp/wbld-abc123")
+
+
+def test_analyze(log, tmp_path):
+    path = tmp_path.joinpath("combined.txt")
+    path.write_text(log)
+    failure = analyze(path)
+
+    assert failure.errors == [
+        "/tmp/wbld-abc123/wled00/fx.cpp:142:5: error: 'strip' was not declared in this scope",
+        "/tmp/wbld-abc123/wled00/wled.h:30:10: fatal error: FastLED.h: No such file or directory",
+        "*** [.pio/build/d1_mini/src/fx.cpp.o] Error 1",
+        "/tmp/wbld-abc123/.pio/build/d1_mini/src/wled.cpp.o:(.text.setup+0x4): undefined reference to `WLED::instance()'",
+        "collect2: error: ld returned 1 exit status",
+    ]
+    assert failure.missing == ["FastLED.h"]
+    assert failure.summary[0].startswith("Environment")
+    assert failure.summary[-1].startswith("=====") and "1 failed" in failure.summary[-1]
+    assert failure.signature
+
+
+def test_analyze_successful_log(tmp_path):
+    path = tmp_path.joinpath("combined.txt")
+    path.write_text("Compiling .pio/build/d1_mini/src/wled.cpp.o\n=== [SUCCESS] Took 1.00 seconds ===\n")
+    failure = analyze(path)
+
+    assert not failure.errors
+    assert failure.signature is None
+    assert failure.summary == ["=== [SUCCESS] Took 1.00 seconds ==="]
+
+
+def test_analyze_limits_lines(tmp_path):
+    path = tmp_path.joinpath("combined.txt")
+    path.write_text("".join(f"src/file{index}.cpp:1:1: error: {'x' * 1000}\n" for index in range(100)))
+    failure = analyze(path)
+
+    assert len(failure.errors) == MAX_LINES
+    assert all(len(line) <= 300 for line in failure.errors)
+
+
+def test_signature_ignores_paths_and_line_numbers(tmp_path):
+    first = tmp_path.joinpath("first.txt")
+    first.write_text(LOG.format(env="d1_mini", root="/tmp/wbld-abc123"))
+    second = tmp_path.joinpath("second.txt")
+    second.write_text(LOG.format(env="d1_mini", root="/tmp/wbld-xyz789").replace("fx.cpp:142:5", "fx.cpp:150:5"))
+    other = tmp_path.joinpath("other.txt")
+    other.write_text("src/main.cpp:1:1: error: expected ';' before '}' token\n")
+
+    assert analyze(first).signature == analyze(second).signature
+    assert analyze(first).signature != analyze(other).signature
+
+
+def test_failures_are_grouped(log):
+    same = [failed_build(log), failed_build(LOG.format(env="d1_mini", root="/tmp/wbld-other"))]
+    different = failed_build("src/main.cpp:1:1: error: expected ';' before '}' token\n")
+
+    groups = BuildIndex.failures()
+    assert [len(group) for _, group in groups] == [2, 1]
+    assert {entry.build_id for entry in groups[0][1]} == {build.build_id for build in same}
+    assert groups[1][1][0].build_id == different.build_id
+
+    entries, _ = BuildIndex.query(failure=same[0].failure.signature)
+    assert len(entries) == 2
+
+
+def test_failure_message(log):
+    build = failed_build(log)
+    failed_build(log)
+    message = WbldCog(None, "https://wbld.app", "main")._failure_message(build)  # pylint: disable=protected-access
+
+    assert "error: 'strip' was not declared in this scope" in message
+    assert "Missing: FastLED.h" in message
+    assert "1 other builds failed the same way" in message
+    assert message.endswith(f"https://wbld.app/data/{build.build_id}/combined.txt")
+
+    build.failure = build.failure.copy(update={"errors": ["x" * 250] * 20})
+    assert len(WbldCog(None, "", "main")._failure_message(build)) <= MESSAGE_LIMIT  # pylint: disable=protected-access
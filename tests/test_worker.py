@@ -0,0 +1,220 @@
+import asyncio
+import json
+import time
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+import pytest
+import shortuuid
+
+from wbld import coordinator, web
+from wbld.build.enums import Kind, State
+from wbld.build.journal import Job, Journal, JobState, LOST_CONTACT
+from wbld.build.models import BuildModel
+from wbld.build.runner import Runner
+from wbld.build.storage import Storage
+from wbld.worker import Worker
+
+AUTHOR = {"id": "3", "name": "fake", "avatar_url": "https://fake.com/avatar.png", "discriminator": "0001"}
+
+
+class FakeBuilder:
+    def __init__(self, job, path):
+        self.build = BuildModel(
+            kind=job.kind,
+            env=job.payload,
+            version=job.version,
+            path=path,
+            sha1="5d6b97a63e4357f09f561f06355b2965be52ace7",
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def run(self):
+        self.build.state = State.BUILDING
+        self.build.file_log.write_text(f"Compiling {self.build.env}\n")
+        time.sleep(0.2)
+        self.build.file_binary.write_bytes(b"firmware")
+        self.build.state = State.SUCCESS if self.build.env != "broken" else State.FAILED
+        return self.build
+
+
+class FakeWorker(Worker):
+    poll_interval = 0.05
+    log_interval = 0.05
+
+    @staticmethod
+    def prepare(job, path):
+        if job.payload == "missing":
+            raise FileNotFoundError(job.payload)
+        return FakeBuilder(job, path)
+
+
+@pytest.fixture(autouse=True)
+def token(monkeypatch):
+    monkeypatch.setattr(coordinator, "API_TOKEN", "secret")
+    monkeypatch.setattr(web, "API_TOKEN", "secret")
+
+
+@pytest.fixture(autouse=True)
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(Runner, "poll_interval", 0.05)
+
+
+@pytest.fixture
+def workspace(tmp_path_factory):
+    return tmp_path_factory.mktemp("worker")
+
+
+def enqueue(env):
+    return Journal.enqueue(
+        kind=Kind.BUILTIN,
+        version="main",
+        payload=env,
+        channel_id=1,
+        message_id=2,
+        author_id=3,
+        author=AUTHOR,
+        remote=True,
+    )
+
+
+async def run_workers(count, workdir=None, timeout=10):
+    async with TestServer(web.create_app()) as server:
+        workers = [
+            FakeWorker(str(server.make_url("")), f"worker-{index}", "secret", workdir=workdir) for index in range(count)
+        ]
+        tasks = [asyncio.ensure_future(worker.run()) for worker in workers]
+        deadline = time.monotonic() + timeout
+        while Journal.unfinished() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for worker in workers:
+            worker.stop()
+        await asyncio.gather(*tasks)
+
+
+def test_workers_build_remote_jobs(workspace):  # pylint: disable=redefined-outer-name
+    jobs = [enqueue(env) for env in ("d1_mini", "esp32dev", "broken", "nodemcuv2")]
+
+    asyncio.run(run_workers(3, workspace))
+
+    assert not Journal.unfinished()
+    for job in jobs:
+        job = Journal.get(job.id)
+        build = BuildModel.parse_build_id(job.build_id)
+        assert job.state == JobState.DONE
+        assert job.worker.startswith("worker-")
+        assert build.author == AUTHOR
+        assert build.sealed
+        assert build.file_log.read_text() == f"Compiling {job.payload}\n"
+        if job.payload == "broken":
+            assert build.state == State.FAILED
+        else:
+            assert build.state == State.SUCCESS
+            assert build.file_binary.read_bytes() == b"firmware"
+
+    assert not list(workspace.iterdir())
+
+
+def test_worker_on_coordinator_host():
+    job = enqueue("d1_mini")
+
+    asyncio.run(run_workers(1))
+
+    job = Journal.get(job.id)
+    build = BuildModel.parse_build_id(job.build_id)
+    # The worker builds in its own directory, so the coordinator's copy survives and its log isn't read back.
+    assert build.path.parent == Storage.base_path
+    assert build.state == State.SUCCESS
+    assert build.file_log.read_text() == "Compiling d1_mini\n"
+    assert build.file_binary.read_bytes() == b"firmware"
+    assert [path.name for path in Storage.base_path.iterdir() if path.is_dir()] == [build.build_id]
+
+
+def test_worker_reports_errors():
+    job = enqueue("missing")
+
+    asyncio.run(run_workers(1))
+
+    job = Journal.get(job.id)
+    assert job.state == JobState.DONE
+    assert job.error == "missing"
+    assert job.build_id is None
+
+
+def test_local_jobs_are_not_claimed():
+    Journal.enqueue(kind=Kind.BUILTIN, version="main", payload="d1_mini", channel_id=1, message_id=2, author_id=3)
+
+    assert Journal.claim("worker-0", 60) is None
+
+
+def test_expired_lease_is_reclaimed():
+    job = enqueue("d1_mini")
+
+    assert Journal.claim("worker-0", -1).id == job.id
+    assert Journal.claim("worker-1", 60).worker == "worker-1"
+    assert not Journal.renew(job.id, "worker-0", 60)
+    assert Journal.renew(job.id, "worker-1", 60)
+
+
+def test_coordinator_requires_token(monkeypatch):
+    async def claim(headers):
+        async with TestServer(web.create_app()) as server, ClientSession(headers=headers) as session:
+            async with session.post(server.make_url("/api/jobs/claim?worker=worker-0")) as response:
+                return response.status
+
+    enqueue("d1_mini")
+
+    assert asyncio.run(claim({})) == 401
+    assert asyncio.run(claim({"Authorization": "Bearer wrong"})) == 401
+    monkeypatch.setattr(coordinator, "API_TOKEN", None)
+    monkeypatch.setattr(web, "API_TOKEN", None)
+    assert asyncio.run(claim({"Authorization": "Bearer None"})) == 404
+    assert Journal.unfinished()[0].worker is None
+
+
+def test_abandoned_builds_fail(workspace, monkeypatch):  # pylint: disable=redefined-outer-name
+    async def run():
+        async with TestServer(web.create_app()) as server, ClientSession(
+            headers={"Authorization": "Bearer secret"}
+        ) as session:
+
+            async def post(path, worker, **kwargs):
+                url = server.make_url(f"/api/jobs{path}")
+                async with session.post(url, params={"worker": worker}, **kwargs) as response:
+                    return Job.parse_obj(await response.json()) if path == "/claim" and response.status == 200 else None
+
+            async def start(job, worker):
+                path = workspace.joinpath(shortuuid.uuid())
+                path.mkdir()
+                build = FakeBuilder(job, path).build
+                await post(
+                    f"/{job.id}/start", worker, json={"build_id": build.build_id, "build": json.loads(build.json())}
+                )
+                return build.build_id
+
+            # Leases run out right away, so the next claim takes the job over or gives up on it.
+            monkeypatch.setattr(coordinator, "LEASE", -1)
+            job = await post("/claim", "worker-0")
+            first = await start(job, "worker-0")
+            job = await post("/claim", "worker-1")
+            second = await start(job, "worker-1")
+            assert await post("/claim", "worker-2") is None
+
+            monkeypatch.setattr(coordinator, "LEASE", 60)
+            enqueue("esp32dev")
+            other = await post("/claim", "worker-3")
+            third = await start(other, "worker-3")
+            await post(f"/{other.id}/complete", "worker-3", json={"error": "Disk full"})
+            return first, second, third
+
+    enqueue("d1_mini")
+    builds = [BuildModel.parse_build_id(build_id) for build_id in asyncio.run(run())]
+
+    assert [(build.state, build.sealed) for build in builds] == [(State.FAILED, True)] * 3
+    assert [build.reason for build in builds] == [LOST_CONTACT, LOST_CONTACT, "Disk full"]
+    assert not Journal.unfinished()
@@ -0,0 +1,159 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import hashlib
+import json
+from typing import List
+
+from aiohttp import web
+
+from wbld.build.analytics import BuildAnalytics
+from wbld.build.enums import Kind, State
+from wbld.build.index import BuildIndex, Entry
+
+MAX_LIMIT = 200
+
+routes = web.RouteTableDef()
+
+
+def serialize(entry: Entry) -> dict:
+    build = entry.build
+    return {
+        "id": build.build_id,
+        "author": build.author,
+        "created": datetime.fromtimestamp(entry.created, timezone.utc).isoformat(),
+        "duration": build.duration,
+        "env": build.env,
+        "failure": build.failure,
+        "finished": build.finished,
+        "jobs": build.jobs,
+        "kind": build.kind.name.lower(),
+        "reason": build.reason,
+        "sha1": build.sha1,
+        "snippet": build.snippet,
+        "state": build.state.name.lower(),
+        "version": build.version,
+        "links": {
+            "self": f"/api/builds/{build.build_id}",
+            "page": f"/build/{build.build_id}",
+            "log": f"/data/{build.build_id}/combined.txt",
+            "firmware": f"/data/{build.build_id}/firmware.bin" if build.state == State.SUCCESS else None,
+        },
+    }
+
+
+def parse_enum(enum, request: web.Request, name: str):
+    value = request.query.get(name)
+    if not value:
+        return None
+    try:
+        return enum[value.upper()]
+    except KeyError as error:
+        choices = ", ".join(member.name.lower() for member in enum)
+        raise web.HTTPBadRequest(text=f"Invalid {name}: {value}. Expected one of: {choices}") from error
+
+
+def parse_limit(request: web.Request, default: int) -> int:
+    try:
+        return min(MAX_LIMIT, max(1, int(request.query.get("limit", default))))
+    except ValueError as error:
+        raise web.HTTPBadRequest(text=f"Invalid limit: {request.query['limit']}") from error
+
+
+def not_modified(request: web.Request, etag: str, modified: float) -> bool:
+    """
+    Evaluates the conditional headers of a GET request. `If-None-Match` takes precedence over `If-Modified-Since`.
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return int(modified) <= since.timestamp()
+    return False
+
+
+def conditional(request: web.Request, etag: str, modified: float, **kwargs) -> web.Response:
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(datetime.fromtimestamp(int(modified), timezone.utc), usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if not_modified(request, etag, modified):
+        return web.Response(status=304, headers=headers)
+    return web.json_response(headers=headers, **kwargs)
+
+
+def page_etag(entries: List[Entry], cursor: str) -> str:
+    digest = hashlib.sha1()
+    for entry in entries:
+        digest.update(entry.etag.encode())
+    digest.update(str(cursor).encode())
+    return f'"{digest.hexdigest()}"'
+
+
+@routes.get("/api/builds")
+async def list_builds(request):
+    limit = parse_limit(request, 50)
+    try:
+        entries, cursor = BuildIndex.query(
+            env=request.query.get("env"),
+            state=parse_enum(State, request, "state"),
+            kind=parse_enum(Kind, request, "kind"),
+            author=request.query.get("author"),
+            failure=request.query.get("failure"),
+            cursor=request.query.get("cursor"),
+            limit=limit,
+        )
+    except ValueError as error:
+        raise web.HTTPBadRequest(text=str(error)) from error
+
+    next_url = str(request.rel_url.update_query(cursor=cursor)) if cursor else None
+    modified = max((entry.modified for entry in entries), default=0)
+    return conditional(
+        request,
+        page_etag(entries, cursor),
+        modified,
+        data={"builds": [serialize(entry) for entry in entries], "cursor": cursor, "next": next_url},
+    )
+
+
+@routes.get("/api/builds/{build_id}")
+async def get_build(request):
+    try:
+        entry = BuildIndex.get(request.match_info["build_id"])
+    except FileNotFoundError as error:
+        raise web.HTTPNotFound(text=str(error)) from error
+    return conditional(request, entry.etag, entry.modified, data=serialize(entry))
+
+
+@routes.get("/api/failures")
+async def list_failures(request):
+    groups = BuildIndex.failures()
+    entries = [entry for _, group in groups for entry in group]
+    modified = max((entry.modified for entry in entries), default=0)
+    data = {
+        "failures": [
+            {
+                "signature": signature,
+                "count": len(group),
+                "failure": group[0].build.failure,
+                "builds": [entry.build_id for entry in group],
+            }
+            for signature, group in groups
+        ]
+    }
+    return conditional(request, page_etag(entries, None), modified, data=data)
+
+
+@routes.get("/api/stats")
+async def stats(request):
+    data = BuildAnalytics.summary(limit=parse_limit(request, 10))
+    etag = f'"{hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()}"'
+    modified = max((entry.modified for entry in BuildIndex.entries.values()), default=0)
+    return conditional(request, etag, modified, data=data)
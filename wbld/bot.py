@@ -5,12 +5,15 @@ from discord.ext import commands
 from wbld.log import logger
 from wbld.cogs.wbld import WbldCog
 from wbld.cogs.health import Health
+from wbld.diagnostics import DIAGNOSTICS, serve as serve_diagnostics
 
 BASE_URL = os.getenv("BASE_URL", "https://wbld.app")
 TOKEN = os.getenv("DISCORD_TOKEN")
 PING_URL = os.getenv("PING_URL")
 PREFIXES = [os.getenv("DISCORD_PREFIX", "./")]
 DEFAULT_BRANCH = os.getenv("DEFAULT_BRANCH", "main")
+BUILD_CONCURRENCY = int(os.getenv("BUILD_CONCURRENCY", "2"))
+BUILD_REMOTE = os.getenv("BUILD_MODE", "local") == "remote"
 
 
 class Bot(commands.Bot):
@@ -33,7 +36,9 @@ if __name__ == "__main__":
     if TOKEN:
         if PING_URL:
             bot.add_cog(Health(bot, PING_URL))
-        bot.add_cog(WbldCog(bot, BASE_URL, DEFAULT_BRANCH))
+        bot.add_cog(WbldCog(bot, BASE_URL, DEFAULT_BRANCH, BUILD_CONCURRENCY, BUILD_REMOTE))
+        if DIAGNOSTICS:
+            bot.loop.create_task(serve_diagnostics())
         bot.run(TOKEN)
     else:
         logger.error("Please set your DISCORD_TOKEN.")
@@ -0,0 +1,209 @@
+"""
+Statistics over finished builds: durations, failure rates and build cache hit rates per env, platform and author,
+plus the hours builds are started in.
+
+Aggregates are kept up to date from `BuildIndex` rather than by reading builds again. A build is added once it's
+finished and taken out again if its entry changes or disappears, so a refresh only touches builds that changed since
+the last one. The durations of successful builds are kept sorted for percentiles and estimates. Aggregates are only
+used while holding the lock of `BuildIndex`, so the bot can compute statistics in executor threads.
+"""
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import ClassVar, Dict, List, Optional, Tuple
+
+from wbld.build.enums import State
+from wbld.build.index import BuildIndex, Entry
+from wbld.build.storage import Storage
+
+# Fewer successful builds than this aren't used to estimate a duration.
+MIN_SAMPLES = 3
+
+
+def percentile(ordered: List[float], percent: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))]
+
+
+class Aggregate:
+    """
+    Counts and durations of a group of finished builds.
+    """
+
+    __slots__ = ("succeeded", "failed", "cancelled", "durations", "compiled", "cached")
+
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.durations: List[float] = []
+        self.compiled = 0
+        self.cached = 0
+
+    @property
+    def builds(self) -> int:
+        return self.succeeded + self.failed + self.cancelled
+
+    @property
+    def failure_rate(self) -> Optional[float]:
+        finished = self.succeeded + self.failed
+        return self.failed / finished if finished else None
+
+    @property
+    def cache_hit_rate(self) -> Optional[float]:
+        objects = self.compiled + self.cached
+        return self.cached / objects if objects else None
+
+    def add(self, build, sign: int = 1):
+        """
+        Adds the build to the aggregate, or takes it out again with a `sign` of `-1`.
+        """
+        if build.state == State.SUCCESS:
+            self.succeeded += sign
+            if build.duration is not None:
+                if sign > 0:
+                    insort(self.durations, build.duration)
+                else:
+                    del self.durations[bisect_left(self.durations, build.duration)]
+        elif build.state == State.FAILED:
+            self.failed += sign
+        else:
+            self.cancelled += sign
+        self.compiled += sign * (build.objects_compiled or 0)
+        self.cached += sign * (build.objects_cached or 0)
+
+    def summary(self) -> dict:
+        return {
+            "builds": self.builds,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "failure_rate": self.failure_rate,
+            "cache_hit_rate": self.cache_hit_rate,
+            "duration": {f"p{percent}": percentile(self.durations, percent) for percent in (50, 90, 95)},
+        }
+
+
+class BuildAnalytics:
+    """
+    Aggregates of the builds in `BuildIndex`, updated whenever its `generation` changes.
+    """
+
+    path: ClassVar[Optional[Path]] = None
+    generation: ClassVar[Optional[int]] = None
+    applied: ClassVar[Dict[str, Entry]] = {}
+    total: ClassVar[Aggregate] = Aggregate()
+    envs: ClassVar[Dict[str, Aggregate]] = {}
+    platforms: ClassVar[Dict[str, Aggregate]] = {}
+    authors: ClassVar[Dict[str, Aggregate]] = {}
+    author_names: ClassVar[Dict[str, str]] = {}
+    hours: ClassVar[List[int]] = [0] * 24
+
+    @classmethod
+    def _reset(cls):
+        cls.path = Storage.base_path
+        cls.generation = None
+        cls.applied = {}
+        cls.total = Aggregate()
+        cls.envs = {}
+        cls.platforms = {}
+        cls.authors = {}
+        cls.author_names = {}
+        cls.hours = [0] * 24
+
+    @classmethod
+    def _groups(cls, build) -> List[Aggregate]:
+        groups = [cls.total, cls.envs.setdefault(build.env, Aggregate())]
+        if build.platform:
+            groups.append(cls.platforms.setdefault(build.platform, Aggregate()))
+        if build.author:
+            groups.append(cls.authors.setdefault(build.author["id"], Aggregate()))
+        return groups
+
+    @classmethod
+    def _add(cls, entry: Entry, sign: int):
+        build = entry.build
+        for group in cls._groups(build):
+            group.add(build, sign)
+        cls.hours[datetime.fromtimestamp(entry.created, timezone.utc).hour] += sign
+        if sign > 0 and build.author:
+            cls.author_names[build.author["id"]] = build.author["name"]
+
+    @classmethod
+    def refresh(cls):
+        with BuildIndex.lock:
+            BuildIndex.refresh()
+            if cls.path != Storage.base_path:
+                cls._reset()
+            if cls.generation == BuildIndex.generation:
+                return
+
+            # Entries are replaced when their build changes, so an entry that isn't the one we added is stale.
+            entries = BuildIndex.entries
+            for build_id, entry in list(cls.applied.items()):
+                if entries.get(build_id) is not entry:
+                    cls._add(entry, -1)
+                    del cls.applied[build_id]
+            for build_id, entry in entries.items():
+                if build_id not in cls.applied and entry.build.finished:
+                    cls._add(entry, 1)
+                    cls.applied[build_id] = entry
+            cls.generation = BuildIndex.generation
+
+    @classmethod
+    def estimate(cls, env: str, platform: str = None) -> Optional[float]:
+        """
+        The median duration of successful builds of `env`, falling back to builds of the same platform and then to
+        all builds if there aren't enough of them.
+        """
+        with BuildIndex.lock:
+            cls.refresh()
+            for group in (cls.envs.get(env), cls.platforms.get(platform), cls.total):
+                if group and len(group.durations) >= MIN_SAMPLES:
+                    return percentile(group.durations, 50)
+            return None
+
+    @staticmethod
+    def remaining(estimate: Optional[float], elapsed: float, fraction: float = None) -> Optional[float]:
+        """
+        Seconds left of a build expected to take `estimate` seconds after running for `elapsed` seconds. Without an
+        estimate, the `fraction` of objects built so far is extrapolated.
+        """
+        if estimate is None and fraction:
+            estimate = elapsed / fraction
+        if estimate is None:
+            return None
+        return max(0.0, estimate - elapsed)
+
+    @staticmethod
+    def _top(groups: Dict[str, Aggregate], limit: int) -> List[Tuple[str, Aggregate]]:
+        busiest = sorted(groups.items(), key=lambda group: group[1].builds, reverse=True)
+        return [(key, group) for key, group in busiest if group.builds][:limit]
+
+    @classmethod
+    def env_summary(cls, env: str) -> Optional[dict]:
+        """
+        The statistics of `env`, or None without finished builds of it.
+        """
+        with BuildIndex.lock:
+            cls.refresh()
+            group = cls.envs.get(env)
+            return group.summary() if group and group.builds else None
+
+    @classmethod
+    def summary(cls, limit: int = 10) -> dict:
+        with BuildIndex.lock:
+            cls.refresh()
+            return {
+                **cls.total.summary(),
+                "envs": [{"name": env, **group.summary()} for env, group in cls._top(cls.envs, limit)],
+                "platforms": [
+                    {"name": platform, **group.summary()} for platform, group in cls._top(cls.platforms, limit)
+                ],
+                "requesters": [
+                    {"id": author_id, "name": cls.author_names.get(author_id), **group.summary()}
+                    for author_id, group in cls._top(cls.authors, limit)
+                ],
+                "hours": list(cls.hours),
+            }
@@ -11,3 +11,4 @@ class State(IntEnum):
     BUILDING = 2
     SUCCESS = 3
     FAILED = 4
+    CANCELLED = 5
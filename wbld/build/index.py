@@ -0,0 +1,204 @@
+import base64
+from datetime import datetime
+import os
+from pathlib import Path
+import re
+import threading
+from time import monotonic
+from typing import ClassVar, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from wbld.build.enums import Kind, State
+from wbld.build.models import BuildModel, BuildRecord
+from wbld.build.storage import Storage
+from wbld.log import logger
+
+BUILD_ID = re.compile(r"^[a-zA-Z0-9]{22}$")
+
+
+class Entry(NamedTuple):
+    build: BuildRecord
+    created: float
+    modified: float
+    modified_ns: int
+    size: int
+
+    @property
+    def build_id(self) -> str:
+        return self.build.build_id
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.build_id}-{self.modified_ns:x}-{self.size:x}"'
+
+    @property
+    def sort_key(self) -> Tuple[float, str]:
+        return self.created, self.build_id
+
+
+class BuildIndex:
+    """
+    In-memory index of the builds in `Storage.base_path`, shared by the API and the web pages.
+
+    Builds are read as `BuildRecord` and only read again when the size or modification time of their `build.json`
+    changed. Builds written in this process are reloaded on the next query. Writes from other processes (the bot,
+    build workers) are picked up by a full scan once `Storage.signature` changed, at most every `refresh_interval`
+    seconds. `generation` changes whenever an entry does. Builds are ordered newest first by the creation time of
+    their directory. Refreshes hold `lock`, so the index can also be used from executor threads.
+    """
+
+    refresh_interval: ClassVar[float] = float(os.getenv("BUILD_INDEX_REFRESH", "1.0"))
+    entries: ClassVar[Dict[str, Entry]] = {}
+    ordered: ClassVar[Optional[List[Entry]]] = None
+    path: ClassVar[Optional[Path]] = None
+    refreshed: ClassVar[float] = 0.0
+    signature: ClassVar[Optional[tuple]] = None
+    generation: ClassVar[int] = 0
+    dirty: ClassVar[Set[str]] = set()
+    lock: ClassVar[threading.RLock] = threading.RLock()
+
+    @classmethod
+    def _check_storage(cls):
+        if cls.path != Storage.base_path:
+            cls.entries = {}
+            cls._changed()
+            cls.path = Storage.base_path
+            cls.refreshed = 0.0
+            cls.signature = None
+            cls.dirty = set()
+
+    @classmethod
+    def _changed(cls):
+        cls.ordered = None
+        cls.generation += 1
+
+    @classmethod
+    def invalidate(cls, build: BuildModel):
+        if cls.path is not None and build.path.parent == cls.path:
+            cls.dirty.add(build.build_id)
+
+    @classmethod
+    def _load(cls, build_id: str, cached: Optional[Entry]) -> Optional[Entry]:
+        directory = Storage.base_path.joinpath(build_id)
+        try:
+            stat = directory.joinpath(BuildModel.build_file).stat()
+        except FileNotFoundError:
+            return None
+        if cached and cached.modified_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+            return cached
+
+        try:
+            build = BuildRecord.load(directory)
+        except (OSError, ValueError) as error:
+            # Most likely a write in progress, keep serving what we had.
+            logger.debug(f"Couldn't read build {build_id}: {error}")
+            return cached
+
+        created = cached.created if cached else directory.stat().st_ctime
+        build._date = datetime.fromtimestamp(created)  # pylint: disable=protected-access
+        entry = Entry(build, created, stat.st_mtime, stat.st_mtime_ns, stat.st_size)
+        cls.entries[build_id] = entry
+        cls._changed()
+        return entry
+
+    @classmethod
+    def refresh(cls, force: bool = False):
+        with cls.lock:
+            cls._check_storage()
+            if not force:
+                while cls.dirty:
+                    build_id = cls.dirty.pop()
+                    if not cls._load(build_id, cls.entries.get(build_id)) and cls.entries.pop(build_id, None):
+                        cls._changed()
+                if monotonic() - cls.refreshed < cls.refresh_interval or Storage.signature() == cls.signature:
+                    return
+
+            cls.refreshed = monotonic()
+            cls.signature = Storage.signature()
+            cls.dirty = set()
+            seen = set()
+            with os.scandir(Storage.base_path) as directories:
+                for directory in directories:
+                    if directory.is_dir() and cls._load(directory.name, cls.entries.get(directory.name)):
+                        seen.add(directory.name)
+
+            for build_id in set(cls.entries) - seen:
+                del cls.entries[build_id]
+                cls._changed()
+
+    @classmethod
+    def get(cls, build_id: str) -> Entry:
+        with cls.lock:
+            cls._check_storage()
+            entry = cls._load(build_id, cls.entries.get(build_id)) if BUILD_ID.match(build_id) else None
+            if not entry:
+                if cls.entries.pop(build_id, None):
+                    cls._changed()
+                raise FileNotFoundError(f"Build not found: {build_id}")
+            return entry
+
+    @staticmethod
+    def encode_cursor(entry: Entry) -> str:
+        return base64.urlsafe_b64encode(f"{entry.created!r}:{entry.build_id}".encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[float, str]:
+        try:
+            created, build_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+            return float(created), build_id
+        except (ValueError, UnicodeDecodeError) as error:
+            raise ValueError(f"Invalid cursor: {cursor}") from error
+
+    # pylint: disable=too-many-arguments
+    @classmethod
+    def query(
+        cls,
+        env: str = None,
+        state: State = None,
+        kind: Kind = None,
+        author: str = None,
+        failure: str = None,
+        cursor: str = None,
+        limit: Optional[int] = 50,
+    ) -> Tuple[List[Entry], Optional[str]]:
+        """
+        Returns the builds matching all given filters, newest first, and the cursor of the next page if there is one.
+        `author` matches the id or the name of the author, `failure` the signature of the failure.
+        """
+        with cls.lock:
+            cls.refresh()
+            if cls.ordered is None:
+                cls.ordered = sorted(cls.entries.values(), key=lambda entry: entry.sort_key, reverse=True)
+            ordered = cls.ordered
+
+        after = cls.decode_cursor(cursor) if cursor else None
+        author = author.lower() if author else None
+        page = []
+        for entry in ordered:
+            build = entry.build
+            if after and entry.sort_key >= after:
+                continue
+            if (env and build.env != env) or (state and build.state != state) or (kind and build.kind != kind):
+                continue
+            if author and not (build.author and author in (build.author["id"], build.author["name"].lower())):
+                continue
+            if failure and not (build.failure and build.failure.get("signature") == failure):
+                continue
+            if limit is not None and len(page) == limit:
+                return page, cls.encode_cursor(page[-1])
+            page.append(entry)
+        return page, None
+
+    @classmethod
+    def failures(cls) -> List[Tuple[str, List[Entry]]]:
+        """
+        Groups failed builds by the signature of their failure, most frequent first. Builds are newest first.
+        """
+        entries, _ = cls.query(state=State.FAILED, limit=None)
+        groups: Dict[str, List[Entry]] = {}
+        for entry in entries:
+            if entry.build.failure and entry.build.failure.get("signature"):
+                groups.setdefault(entry.build.failure["signature"], []).append(entry)
+        return sorted(groups.items(), key=lambda group: len(group[1]), reverse=True)
+
+
+BuildModel.observers.append(BuildIndex.invalidate)
@@ -0,0 +1,295 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from enum import Enum
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+from time import time
+from typing import Callable, ClassVar, Iterator, List, Optional
+
+from pydantic import BaseModel
+import shortuuid
+
+from wbld.build.enums import Kind
+from wbld.build.storage import Storage
+
+
+LOST_CONTACT = "Lost contact with the build worker"
+
+
+class JobState(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+
+
+class Job(BaseModel):
+    id: str
+    state: JobState = JobState.QUEUED
+    kind: Kind
+    version: str
+    payload: str
+    channel_id: int
+    message_id: int
+    author_id: int
+    author: dict = None
+    remote: bool = False
+    build_id: str = None
+    worker: str = None
+    lease_expires: float = None
+    error: str = None
+    # Process group of the build, which survives a restart of the bot outside of containers.
+    pgid: int = None
+    attempts: int = 0
+    created: float
+    updated: float
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> Job:
+        data = dict(row)
+        data["author"] = json.loads(data["author"]) if data["author"] else None
+        return cls(**data)
+
+
+class Journal:
+    """
+    Durable record of accepted build requests kept next to the builds in `Storage.base_path`.
+
+    A job is queued when a request is accepted, running once its build starts and done after the user was answered.
+    Jobs that are still queued or running when the bot starts were interrupted and get resumed. Remote jobs are built
+    by workers, which claim them through the coordinator and hold them with a lease they have to keep renewing.
+    """
+
+    filename = "journal.sqlite3"
+    max_attempts = 2
+    # Writes only hold the database for a moment. Waiting on another process blocks the caller's event loop, so give
+    # up after this many seconds rather than stalling the bot.
+    busy_timeout: ClassVar[float] = float(os.getenv("JOURNAL_BUSY_TIMEOUT", "1"))
+    _connection: ClassVar[Optional[sqlite3.Connection]] = None
+    _path: ClassVar[Optional[Path]] = None
+    _lock: ClassVar[threading.RLock] = threading.RLock()
+    schema = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            kind INTEGER NOT NULL,
+            version TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            author_id INTEGER NOT NULL,
+            author TEXT,
+            remote INTEGER NOT NULL DEFAULT 0,
+            build_id TEXT,
+            worker TEXT,
+            lease_expires REAL,
+            error TEXT,
+            pgid INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+    """
+    # Columns added to the jobs table by each version of the schema, stored in `PRAGMA user_version`.
+    migrations = [
+        ["author TEXT", "remote INTEGER NOT NULL DEFAULT 0", "worker TEXT", "lease_expires REAL", "error TEXT"],
+        ["pgid INTEGER"],
+    ]
+
+    @classmethod
+    def migrate(cls, connection: sqlite3.Connection):
+        """
+        Adds the columns missing from journals written by older versions. New journals get all of them from the
+        schema, so only the version is set there.
+        """
+        if connection.execute("PRAGMA user_version").fetchone()[0] >= len(cls.migrations):
+            return
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            existing = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+            for columns in cls.migrations[version:]:
+                for column in columns:
+                    if column.split()[0] not in existing:
+                        connection.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+            connection.execute(f"PRAGMA user_version = {max(version, len(cls.migrations))}")
+
+    @classmethod
+    def _open(cls) -> sqlite3.Connection:
+        """
+        The connection of this process, opened and brought up to date with the schema on first use.
+        """
+        path = Storage.base_path.joinpath(cls.filename)
+        if cls._connection is not None and cls._path == path:
+            return cls._connection
+        if cls._connection is not None:
+            cls._connection.close()
+            cls._connection = None
+
+        Storage.create(parents=True)
+        connection = sqlite3.connect(path, timeout=cls.busy_timeout, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(cls.schema)
+            cls.migrate(connection)
+        except sqlite3.Error:
+            connection.close()
+            raise
+        cls._connection, cls._path = connection, path
+        return connection
+
+    @classmethod
+    @contextmanager
+    def connect(cls) -> Iterator[sqlite3.Connection]:
+        with cls._lock:
+            connection = cls._open()
+            with connection:
+                yield connection
+
+    # pylint: disable=too-many-arguments
+    @classmethod
+    def enqueue(
+        cls,
+        kind: Kind,
+        version: str,
+        payload: str,
+        channel_id: int,
+        message_id: int,
+        author_id: int,
+        author: dict = None,
+        remote: bool = False,
+    ) -> Job:
+        now = time()
+        job = Job(
+            id=shortuuid.uuid(),
+            kind=kind,
+            version=version,
+            payload=payload,
+            channel_id=channel_id,
+            message_id=message_id,
+            author_id=author_id,
+            author=author,
+            remote=remote,
+            created=now,
+            updated=now,
+        )
+        with cls.connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, state, kind, version, payload, channel_id, message_id, author_id, author, "
+                "remote, attempts, created, updated) VALUES (:id, :state, :kind, :version, :payload, :channel_id, "
+                ":message_id, :author_id, :author, :remote, :attempts, :created, :updated)",
+                {
+                    **job.dict(),
+                    "state": job.state.value,
+                    "kind": int(job.kind),
+                    "author": json.dumps(author) if author else None,
+                },
+            )
+        return job
+
+    @classmethod
+    def get(cls, job_id: str) -> Job:
+        with cls.connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if not row:
+            raise KeyError(job_id)
+        return Job.from_row(row)
+
+    @classmethod
+    def start(cls, job_id: str, build_id: str):
+        with cls.connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET state = ?, build_id = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (JobState.RUNNING.value, build_id, time(), job_id),
+            )
+
+    @classmethod
+    def attach(cls, job_id: str, pgid: int):
+        with cls.connect() as connection:
+            connection.execute("UPDATE jobs SET pgid = ?, updated = ? WHERE id = ?", (pgid, time(), job_id))
+
+    @classmethod
+    def finish(cls, job_id: str, error: str = None):
+        with cls.connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET state = ?, error = COALESCE(?, error), updated = ? WHERE id = ?",
+                (JobState.DONE.value, error, time(), job_id),
+            )
+
+    @classmethod
+    def unfinished(cls) -> List[Job]:
+        with cls.connect() as connection:
+            rows = connection.execute(
+                "SELECT * FROM jobs WHERE state != ? ORDER BY created", (JobState.DONE.value,)
+            ).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    @classmethod
+    def claim(cls, worker: str, lease: float, abandon: Callable[[str], None] = None) -> Optional[Job]:
+        """
+        Hands the oldest remote job that is queued, or whose lease ran out, to a worker. Jobs which lost their worker
+        too often are finished with an error instead. `abandon` is called with the build of every job whose worker
+        was given up on, as nobody finishes those builds anymore.
+        """
+        now = time()
+        expired = (JobState.RUNNING.value, now)
+        with cls.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            lost = connection.execute(
+                "SELECT id, build_id FROM jobs WHERE remote = 1 AND state = ? AND lease_expires < ? AND attempts >= ?",
+                (*expired, cls.max_attempts),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET state = ?, error = ?, updated = ? WHERE id = ?",
+                [(JobState.DONE.value, LOST_CONTACT, now, row["id"]) for row in lost],
+            )
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE remote = 1 AND (state = ? OR (state = ? AND lease_expires < ?)) "
+                "ORDER BY created LIMIT 1",
+                (JobState.QUEUED.value, *expired),
+            ).fetchone()
+            if row:
+                connection.execute(
+                    "UPDATE jobs SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "build_id = NULL, updated = ? WHERE id = ?",
+                    (JobState.RUNNING.value, worker, now + lease, now, row["id"]),
+                )
+
+        abandoned = [lost_row["build_id"] for lost_row in lost] + ([row["build_id"]] if row else [])
+        for build_id in abandoned:
+            if abandon and build_id:
+                abandon(build_id)
+        return cls.get(row["id"]) if row else None
+
+    @classmethod
+    def renew(cls, job_id: str, worker: str, lease: float, build_id: str = None) -> bool:
+        """
+        Extends the lease of a running job, optionally recording its build. Returns False if the worker lost the job.
+        """
+        now = time()
+        with cls.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires = ?, build_id = COALESCE(?, build_id), updated = ? "
+                "WHERE id = ? AND worker = ? AND state = ?",
+                (now + lease, build_id, now, job_id, worker, JobState.RUNNING.value),
+            )
+        return cursor.rowcount == 1
+
+    @classmethod
+    @contextmanager
+    def track(cls, job: Job):
+        """
+        Marks the job done when the block completes or raises an error the user is told about. Cancellation and
+        interpreter shutdown propagate without marking it, so the job is resumed on the next start.
+        """
+        try:
+            yield job
+        except Exception:
+            cls.finish(job.id)
+            raise
+        else:
+            cls.finish(job.id)
@@ -1,9 +1,9 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import ClassVar, Union
+import json
+from pathlib import Path
+from typing import ClassVar, List, Optional, Union
 
-from discord import Member, User
-import humanize
 from pydantic import BaseModel, constr, DirectoryPath, validator, Field
 
 from wbld.build.enums import Kind, State
@@ -17,50 +17,61 @@ class Author:
         yield cls.validate
 
     @classmethod
-    def validate(cls, author: Union[Member, User]):
-        types = Union[Member, User]
+    def validate(cls, author: Union["Member", "User"]):
         fields = ["id", "name", "avatar_url", "discriminator"]
 
-        if isinstance(author, types.__args__):
-            return dict([(name, str(getattr(author, name))) for name in fields])
-        elif isinstance(author, dict):
+        if isinstance(author, dict):
             if set(author) == set(fields):
                 return author
+            raise TypeError("Invalid value")
+
+        # Stored authors are plain dicts, so discord.py is only needed when a build is started from a command.
+        from discord import Member, User  # pylint: disable=import-outside-toplevel
+
+        if isinstance(author, (Member, User)):
+            return dict([(name, str(getattr(author, name))) for name in fields])
 
         raise TypeError("Invalid value")
 
 
-class BuildModel(BaseModel):
-    author: Author = None
-    build_file: ClassVar[str] = "build.json"
-    duration: float = None
-    env: str
-    kind: Kind
-    path: DirectoryPath = Field(default_factory=Storage.generate_build_uuid_path)
-    sha1: constr(regex=r"^[0-9a-f]{40}$")
-    snippet: str = None
-    state: State = State.PENDING
-    version: str
+class Failure(BaseModel):
+    """
+    The lines of a failed build's log worth showing, see `wbld.build.triage`.
+    """
 
-    class Config:
-        arbitrary_types_allowed = True
-        validate_assignment = True
-        underscore_attrs_are_private = True
+    errors: List[str] = []
+    missing: List[str] = []
+    summary: List[str] = []
+    signature: str = None
 
-    def __setattr__(self, name, value):
-        super(BuildModel, self).__setattr__(name, value)
-        self.write()
+    @property
+    def lines(self) -> List[str]:
+        return self.errors + [f"Missing: {name}" for name in self.missing] + self.summary
+
+
+class BuildProperties:
+    """
+    Properties shared by the writable `BuildModel` and the read-only `BuildRecord`.
+    """
+
+    __slots__ = ()
 
     @property
     def date(self):
-        return datetime.fromtimestamp(self.path.lstat().st_ctime)
+        if self._date is None:
+            self._date = datetime.fromtimestamp(self.path.lstat().st_ctime)
+        return self._date
 
     @property
     def date_diff_human(self):
+        import humanize  # pylint: disable=import-outside-toplevel
+
         return humanize.naturaldelta(self.date)
 
     @property
     def duration_human(self):
+        import humanize  # pylint: disable=import-outside-toplevel
+
         return humanize.precisedelta(self.duration)
 
     @property
@@ -71,10 +82,54 @@ class BuildModel(BaseModel):
     def file_binary(self) -> DirectoryPath:
         return self.path.joinpath("firmware.bin")
 
+    @property
+    def file_cancel(self):
+        return self.path.joinpath("cancel")
+
+    @property
+    def finished(self):
+        return self.state in (State.SUCCESS, State.FAILED, State.CANCELLED)
+
     @property
     def build_id(self):
         return self.path.stem
 
+
+class BuildModel(BuildProperties, BaseModel):
+    author: Author = None
+    build_file: ClassVar[str] = "build.json"
+    # Called with the build after every write, so in-process caches don't have to wait for file modification times.
+    observers: ClassVar[list] = []
+    duration: float = None
+    env: str
+    failure: Failure = None
+    jobs: int = None
+    kind: Kind
+    # Objects compiled and retrieved from the PlatformIO build cache.
+    objects_cached: int = None
+    objects_compiled: int = None
+    path: DirectoryPath = Field(default_factory=Storage.generate_build_uuid_path)
+    platform: str = None
+    reason: str = None
+    # Set by the last write of a build, once nothing changes it anymore.
+    sealed: bool = False
+    sha1: constr(regex=r"^[0-9a-f]{40}$")
+    snippet: str = None
+    state: State = State.PENDING
+    version: str
+
+    class Config:
+        arbitrary_types_allowed = True
+        validate_assignment = True
+        underscore_attrs_are_private = True
+
+    _date: Optional[datetime] = None
+
+    def __setattr__(self, name, value):
+        super(BuildModel, self).__setattr__(name, value)
+        if name not in self.__private_attributes__:
+            self.write()
+
     @validator("path")
     @classmethod
     def check_path_contains_shortuuid(cls, value):
@@ -84,12 +139,85 @@ class BuildModel(BaseModel):
 
     def write(self):
         with self.path.joinpath(self.build_file).open("w") as build_info:
-            build_info.write(self.json(exclude={"build_file"}))
+            # The path is where the file lives, storing it would break moving the storage directory.
+            build_info.write(self.json(exclude={"build_file", "path"}))
+        if self.path.parent == Storage.base_path:
+            Storage.mark_changed()
+        for observer in self.observers:
+            observer(self)
 
     @classmethod
     def parse_build_id(cls, build_id: str) -> BuildModel:
-        return cls.parse_file(Storage.base_path.joinpath(build_id).joinpath(cls.build_file))
+        return cls.parse_build_path(Storage.base_path.joinpath(build_id))
 
     @classmethod
     def parse_build_path(cls, build_path: DirectoryPath) -> BuildModel:
-        return cls.parse_file(build_path.joinpath(cls.build_file))
+        data = json.loads(build_path.joinpath(cls.build_file).read_bytes())
+        return cls.parse_obj({**data, "path": build_path})
+
+
+class BuildRecord(BuildProperties):
+    """
+    Lightweight, read-only view of a stored build for listing and serving.
+
+    Loading a record only decodes the JSON and converts the enums, without the validation `BuildModel` does. Use it
+    for files written by `BuildModel` and `BuildModel` for anything that's written or comes from outside. Nested values
+    like `author` and `failure` stay plain dicts.
+    """
+
+    __slots__ = (
+        "author",
+        "duration",
+        "env",
+        "failure",
+        "jobs",
+        "kind",
+        "objects_cached",
+        "objects_compiled",
+        "path",
+        "platform",
+        "reason",
+        "sealed",
+        "sha1",
+        "snippet",
+        "state",
+        "version",
+        "_date",
+    )
+
+    def __init__(self, path: Path, data: dict):
+        self.path = path
+        self.author = data.get("author")
+        self.duration = data.get("duration")
+        self.env = data["env"]
+        self.failure = data.get("failure")
+        self.jobs = data.get("jobs")
+        self.kind = Kind(data["kind"])
+        self.objects_cached = data.get("objects_cached")
+        self.objects_compiled = data.get("objects_compiled")
+        self.platform = data.get("platform")
+        self.reason = data.get("reason")
+        self.sealed = data.get("sealed", False)
+        self.sha1 = data["sha1"]
+        self.snippet = data.get("snippet")
+        self.state = State(data.get("state", State.PENDING))
+        self.version = data["version"]
+        self._date = None
+
+    def __repr__(self):
+        return f"BuildRecord({self.build_id}, env={self.env!r}, state={self.state.name})"
+
+    @classmethod
+    def load(cls, build_path: Path) -> BuildRecord:
+        """
+        Reads the record of the build in `build_path`. Raises `ValueError` if the file isn't a valid build.
+        """
+        with open(build_path.joinpath(BuildModel.build_file), "rb") as build_info:
+            data = json.loads(build_info.read())
+        try:
+            return cls(build_path, data)
+        except (KeyError, TypeError) as error:
+            raise ValueError(f"Invalid build {build_path.name}: {error!r}") from error
+
+    def model(self) -> BuildModel:
+        return BuildModel.parse_build_path(self.path)
@@ -0,0 +1,196 @@
+import asyncio
+import multiprocessing
+import os
+from pathlib import Path
+import resource
+import signal
+from timeit import default_timer as timer
+from typing import Callable, ClassVar, Dict, Optional
+
+from wbld.log import logger
+from wbld.build.enums import State
+from wbld.build.models import BuildModel
+from wbld.build.scheduler import Scheduler
+from wbld.build.triage import analyze
+
+
+class Runner:
+    """
+    Runs a builder in its own process group so a hung or runaway PlatformIO build can be killed as a whole.
+
+    Limits are read from the environment. `BUILD_TIMEOUT` is the wall-clock limit in seconds for the whole build.
+    `BUILD_CPU_LIMIT` (seconds) and `BUILD_MEMORY_LIMIT` (bytes) are applied as rlimits to every process of the build.
+    A value of `0` disables the limit.
+
+    Objects compiled and retrieved from the PlatformIO build cache are counted from the log and stored with the build.
+    If a `progress` callback is given, it's called with the number of objects built so far and the number the last
+    successful build of the same env built, if known. `started` is called with the process group of every build
+    process started.
+    """
+
+    timeout: ClassVar[float] = float(os.getenv("BUILD_TIMEOUT", "900"))
+    cpu_limit: ClassVar[int] = int(os.getenv("BUILD_CPU_LIMIT", "1800"))
+    memory_limit: ClassVar[int] = int(os.getenv("BUILD_MEMORY_LIMIT", "0"))
+    poll_interval: ClassVar[float] = 0.5
+    running: ClassVar[Dict[str, "Runner"]] = {}
+    compiled_objects: ClassVar[Dict[str, int]] = {}
+
+    def __init__(
+        self,
+        builder,
+        progress: Callable[[int, Optional[int]], None] = None,
+        started: Callable[[int], None] = None,
+    ):
+        self.builder = builder
+        self.build: BuildModel = builder.build
+        self.process = None
+        self.progress = progress
+        self.started = started
+        self.compiled = 0
+        self.cached = 0
+        self._log_offset = 0
+
+    def _set_limits(self):
+        if self.cpu_limit:
+            resource.setrlimit(resource.RLIMIT_CPU, (self.cpu_limit, self.cpu_limit + 5))
+        if self.memory_limit:
+            resource.setrlimit(resource.RLIMIT_AS, (self.memory_limit, self.memory_limit))
+
+    def _target(self):
+        os.setsid()
+        self._set_limits()
+        self.builder.run()
+
+    def kill(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            self.process.kill()
+        self.process.join()
+
+    @staticmethod
+    def kill_stale(pgid: int) -> bool:
+        """
+        Kills the process group of a build started before this process restarted. The group is only killed while its
+        leader still runs the same command line as this process, as its build process was forked from it, so a reused
+        process id is left alone. Returns whether the group was killed.
+        """
+        try:
+            if (
+                pgid == os.getpgid(0)
+                or Path(f"/proc/{pgid}/cmdline").read_bytes() != Path("/proc/self/cmdline").read_bytes()
+            ):
+                return False
+            os.killpg(pgid, signal.SIGKILL)
+        except OSError:
+            return False
+        logger.warning(f"Killed build processes left over from before the restart in process group {pgid}")
+        return True
+
+    @classmethod
+    def cancel(cls, build_id: str) -> bool:
+        """
+        Kills a build running in this process right away, instead of waiting for its runner to find the cancel
+        marker. Returns whether the build was running here.
+        """
+        runner = cls.running.get(build_id)
+        if not runner:
+            return False
+        runner.kill()
+        return True
+
+    def _read_progress(self):
+        if not self.build.file_log.exists():
+            return
+
+        with self.build.file_log.open("rb") as log_file:
+            log_file.seek(self._log_offset)
+            data = log_file.read()
+
+        lines = data[: data.rfind(b"\n") + 1]
+        self._log_offset += len(lines)
+        compiled, cached = lines.count(b"Compiling "), lines.count(b"Retrieved `")
+        if compiled or cached:
+            self.compiled += compiled
+            self.cached += cached
+            if self.progress:
+                self.progress(self.compiled + self.cached, self.compiled_objects.get(self.build.env))
+
+    def _finish(self, state: State, reason: str, duration: float):
+        self.build = BuildModel.parse_build_path(self.build.path)
+
+        if not self.build.finished:
+            self.build.reason = reason
+            self.build.duration = duration
+            self.build.state = state
+
+        self.builder.build = self.build
+
+    async def run(self) -> BuildModel:
+        await self._run()
+
+        clone = getattr(self.builder, "clone", None)
+        # Both run git, expanding fetches every blob that's still missing.
+        loop = asyncio.get_running_loop()
+        if clone and await loop.run_in_executor(None, clone.needs_full_checkout, self.build):
+            logger.info(f"Build {self.build.build_id} failed in a sparse checkout, retrying with all files")
+            await loop.run_in_executor(None, clone.expand)
+            self.compiled = 0
+            self.cached = 0
+            self._log_offset = 0
+            self.build.failure = None
+            self.build.reason = None
+            self.build.state = State.PENDING
+            await self._run()
+
+        self.build.sealed = True
+        return self.build
+
+    async def _run(self):
+        self.build.jobs = Scheduler.acquire(self.build.build_id)
+        context = multiprocessing.get_context("fork")
+        self.process = context.Process(target=self._target, name=f"wbld-{self.build.build_id}")
+        timer_start = timer()
+        self.process.start()
+        Runner.running[self.build.build_id] = self
+        if self.started:
+            self.started(self.process.pid)
+        state, reason = State.FAILED, None
+
+        try:
+            while self.process.is_alive():
+                if self.build.file_cancel.exists():
+                    state, reason = State.CANCELLED, self.build.file_cancel.read_text() or "Cancelled"
+                    self.kill()
+                elif self.timeout and timer() - timer_start > self.timeout:
+                    reason = f"Timed out after {self.timeout:.0f} seconds"
+                    self.kill()
+                else:
+                    self._read_progress()
+                    await asyncio.sleep(self.poll_interval)
+            self.process.join()
+            if not reason and self.build.file_cancel.exists():
+                state, reason = State.CANCELLED, self.build.file_cancel.read_text() or "Cancelled"
+        except asyncio.CancelledError:
+            reason = "Interrupted"
+            self.kill()
+            raise
+        finally:
+            del Runner.running[self.build.build_id]
+            Scheduler.release(self.build.build_id)
+            if not reason and self.process.exitcode:
+                reason = f"Build process exited with code {self.process.exitcode}"
+            self._finish(state, reason, float(timer() - timer_start))
+
+        if self.build.state == State.FAILED and self.build.file_log.exists():
+            loop = asyncio.get_running_loop()
+            self.build.failure = await loop.run_in_executor(None, analyze, self.build.file_log)
+
+        if reason:
+            logger.warning(f"Build {self.build.build_id} stopped: {reason}")
+        elif self.build.state in (State.SUCCESS, State.FAILED):
+            self._read_progress()
+            self.build.objects_compiled = self.compiled
+            self.build.objects_cached = self.cached
+            if self.build.state == State.SUCCESS:
+                Runner.compiled_objects[self.build.env] = self.compiled + self.cached
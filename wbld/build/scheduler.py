@@ -0,0 +1,64 @@
+import os
+from typing import ClassVar, Dict
+
+from wbld.log import logger
+
+
+class Scheduler:
+    """
+    Hands out compiler job counts to builds based on host CPUs, builds already running and memory headroom.
+
+    Every build gets an even share of the CPUs available to the process, split between the running builds and itself
+    but at least `concurrency` ways, so a build starting on an idle host leaves room for the builds that can follow it.
+    A build never gets more than the CPUs not yet handed to running builds. The share is capped so that each job has at least `BUILD_MEMORY_PER_JOB` bytes
+    of available memory, after setting aside that much for every job already handed out, as jobs of builds which just
+    started don't use their memory yet. Job counts are fixed once a build starts, so shares rebalance as builds start
+    and finish rather than while they run. Every build gets at least one job.
+    """
+
+    memory_per_job: ClassVar[int] = int(os.getenv("BUILD_MEMORY_PER_JOB", str(384 * 1024 * 1024)))
+    max_jobs: ClassVar[int] = int(os.getenv("BUILD_MAX_JOBS", "0"))
+    # Builds that may run at once, set by the bot or the worker running them.
+    concurrency: ClassVar[int] = 1
+    active: ClassVar[Dict[str, int]] = {}
+
+    @staticmethod
+    def cpu_count() -> int:
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count() or 1
+
+    @staticmethod
+    def available_memory() -> int:
+        try:
+            with open("/proc/meminfo") as meminfo:
+                for line in meminfo:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+    @classmethod
+    def jobs(cls) -> int:
+        reserved = sum(cls.active.values())
+        share = min(cls.cpu_count() // max(len(cls.active) + 1, cls.concurrency), cls.cpu_count() - reserved)
+        memory_jobs = cls.available_memory() // cls.memory_per_job - reserved if cls.memory_per_job else share
+        jobs = min(share, memory_jobs)
+
+        if cls.max_jobs:
+            jobs = min(jobs, cls.max_jobs)
+
+        return max(1, jobs)
+
+    @classmethod
+    def acquire(cls, build_id: str) -> int:
+        jobs = cls.jobs()
+        cls.active[build_id] = jobs
+        logger.debug(f"Scheduled build {build_id} with {jobs} jobs ({len(cls.active)} active builds)")
+        return jobs
+
+    @classmethod
+    def release(cls, build_id: str):
+        cls.active.pop(build_id, None)
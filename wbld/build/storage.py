@@ -7,6 +7,7 @@ import shortuuid
 
 class Storage:
     base_path = Path(os.getenv("STORAGE_DIR", f"{gettempdir()}/wbld"))
+    changes_file = ".changes"
 
     @classmethod
     def create(cls, parents=False, exist_ok=True):
@@ -17,3 +18,21 @@ class Storage:
         path = cls.base_path.joinpath(Path(str(shortuuid.uuid())))
         path.mkdir(parents=True)
         return path
+
+    @classmethod
+    def mark_changed(cls):
+        """
+        Touches the file other processes watch to notice that a build has changed.
+        """
+        cls.base_path.joinpath(cls.changes_file).touch()
+
+    @classmethod
+    def signature(cls) -> tuple:
+        """
+        Changes whenever a build was written, added or removed.
+        """
+        try:
+            changes = cls.base_path.joinpath(cls.changes_file).stat().st_mtime_ns
+        except FileNotFoundError:
+            changes = None
+        return cls.base_path.stat().st_mtime_ns, changes
@@ -0,0 +1,87 @@
+"""
+Extracts the relevant lines of a failed build from its `combined.txt`.
+
+The log is read once, line by line, so large logs aren't loaded into memory. Compiler and linker errors, libraries
+or headers that couldn't be found and the PlatformIO summary at the end end up in a `Failure`. Its signature only
+depends on the errors with paths and line numbers removed, so the same failure in different builds and checkouts
+gets the same signature.
+"""
+import hashlib
+from pathlib import Path
+import re
+from typing import List
+
+from wbld.build.models import Failure
+
+MAX_LINES = 20
+MAX_LENGTH = 300
+
+COMPILER_ERROR = re.compile(r"^(?P<file>[^\s:][^:]*):(?P<line>\d+):(?:\d+:)? (?:fatal )?error: (?P<message>.*)$")
+MISSING_HEADER = re.compile(r"fatal error: (?P<name>[^:\s]+): No such file or directory")
+MISSING_PACKAGE = re.compile(
+    r"(?:UnknownPackageError|Could not find the package with|Library .* has not been found|"
+    r"Unknown board ID|UnknownPlatform|Could not find one of)",
+    re.IGNORECASE,
+)
+LINKER_ERROR = re.compile(
+    r"(?:undefined reference to|multiple definition of|region `[^']+' overflowed by|"
+    r"will not fit in region|collect2: error|ld returned \d+ exit status)"
+)
+PLATFORMIO_ERROR = re.compile(r"^(?:\*\*\* \[.*\] Error \d+|Error: .*)$")
+SUMMARY_TABLE = re.compile(r"^Environment\s+Status\s+Duration")
+SUMMARY_END = re.compile(r"^=+ .*(?:\[(?:SUCCESS|FAILED|ERROR)\]|succeeded|failed).* =+$")
+
+NUMBERS = re.compile(r"\b\d+\b")
+PATH = re.compile(r"(?:[A-Za-z]:)?(?:[^\s:'\"`(]*[/\\])+(?P<name>[^\s:'\"`/\\)]+)")
+
+
+def _clip(line: str) -> str:
+    return line if len(line) <= MAX_LENGTH else line[: MAX_LENGTH - 1] + "…"
+
+
+def _normalize(line: str) -> str:
+    return NUMBERS.sub("N", PATH.sub(r"\g<name>", line))
+
+
+def _add(lines: List[str], line: str):
+    line = _clip(line)
+    if len(lines) < MAX_LINES and line not in lines:
+        lines.append(line)
+
+
+def signature(errors: List[str]) -> str:
+    digest = hashlib.sha1()
+    for line in sorted({_normalize(error) for error in errors}):
+        digest.update(line.encode())
+        digest.update(b"\n")
+    return digest.hexdigest()[:12]
+
+
+def analyze(log: Path) -> Failure:
+    errors, missing, summary = [], [], []
+    in_summary = False
+
+    with log.open("r", encoding="utf-8", errors="replace") as lines:
+        for line in lines:
+            line = line.rstrip()
+            if not line:
+                continue
+
+            if SUMMARY_TABLE.match(line):
+                summary.clear()
+                in_summary = True
+            if in_summary or SUMMARY_END.match(line):
+                _add(summary, line)
+                in_summary = in_summary and not SUMMARY_END.match(line)
+                continue
+
+            missing_header = MISSING_HEADER.search(line)
+            if missing_header:
+                _add(missing, missing_header.group("name"))
+            elif MISSING_PACKAGE.search(line):
+                _add(missing, line)
+
+            if COMPILER_ERROR.match(line) or LINKER_ERROR.search(line) or PLATFORMIO_ERROR.match(line):
+                _add(errors, line)
+
+    return Failure(errors=errors, missing=missing, summary=summary, signature=signature(errors) if errors else None)
@@ -0,0 +1,295 @@
+"""
+Snapshots of the PlatformIO home and the build cache, so new build hosts start with platforms, toolchains and
+libraries already installed instead of downloading them during the first builds.
+
+    python -m wbld.cache export snapshot.tar.gz
+    python -m wbld.cache export --base snapshot.tar.gz delta.tar.gz
+    python -m wbld.cache import snapshot.tar.gz delta.tar.gz
+
+An archive is a gzipped tar file starting with `manifest.json`, which lists every file of the snapshot with its size,
+mode and SHA-256. With `--base` only files which changed since the base archive end up in the archive, together with
+the files that were deleted. Files are hashed again only if their size, mode or modification time changed. Next to
+each archive a `.sha256` file holds the checksum of the whole archive.
+
+Imports check the checksum of the archive and of every file before moving it into place, and refuse archives made on
+another platform or deltas for a snapshot other than the one installed, unless `--force` is given.
+"""
+import argparse
+from datetime import datetime
+import hashlib
+import io
+import json
+import os
+from pathlib import Path, PurePosixPath
+import platform
+import shutil
+import sys
+import tarfile
+from tempfile import NamedTemporaryFile
+from typing import Dict, Iterable, Optional
+
+from wbld.log import logger
+
+FORMAT = 1
+MANIFEST = "manifest.json"
+STATE_FILE = ".wbld-cache.json"
+CHUNK_SIZE = 1024 * 1024
+
+# Downloads in progress and per-host state of PlatformIO.
+EXCLUDE = {"platformio": {".cache/tmp", "appstate.json", "homestate.json", STATE_FILE}, "buildcache": {STATE_FILE}}
+
+
+class CacheError(Exception):
+    pass
+
+
+def sections() -> Dict[str, Path]:
+    """
+    The cached directories by their name in archives.
+    """
+    return {
+        "platformio": Path(os.getenv("PLATFORMIO_CORE_DIR", Path.home().joinpath(".platformio"))),
+        "buildcache": Path(os.getenv("PLATFORMIO_BUILD_CACHE_DIR", Path.home().joinpath(".buildcache"))),
+    }
+
+
+def host() -> dict:
+    return {"platform": sys.platform, "machine": platform.machine()}
+
+
+def checksum(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_id(state: Dict[str, dict]) -> str:
+    digest = hashlib.sha256()
+    for name in sorted(state):
+        entry = state[name]
+        digest.update(f"{name}\0{entry.get('sha256') or entry.get('link')}\0{entry['mode']:o}\n".encode())
+    return digest.hexdigest()
+
+
+def _unchanged(entry: dict, cached: Optional[dict]) -> bool:
+    return bool(cached) and all(cached.get(key) == entry[key] for key in ("size", "mode", "mtime_ns"))
+
+
+def scan(roots: Dict[str, Path], base: Dict[str, dict] = None) -> Dict[str, dict]:
+    """
+    Describes every file and symlink below `roots` by its path in archives. Files unchanged since `base` keep their
+    checksum from there.
+    """
+    base = base or {}
+    state = {}
+    for section, root in roots.items():
+        if not root.is_dir():
+            continue
+        excluded = EXCLUDE.get(section, set())
+        for directory, directories, files in os.walk(root):
+            relative = Path(directory).relative_to(root).as_posix()
+            directories[:] = [name for name in directories if PurePosixPath(relative, name).as_posix() not in excluded]
+            for name in sorted(files) + [name for name in directories if os.path.islink(os.path.join(directory, name))]:
+                path = PurePosixPath(relative, name).as_posix()
+                if path in excluded:
+                    continue
+                full_path = Path(directory, name)
+                stat = full_path.lstat()
+                entry = {"size": stat.st_size, "mode": stat.st_mode & 0o7777, "mtime_ns": stat.st_mtime_ns}
+                if full_path.is_symlink():
+                    entry["link"] = os.readlink(full_path)
+                else:
+                    cached = base.get(f"{section}/{path}")
+                    entry["sha256"] = cached["sha256"] if _unchanged(entry, cached) else checksum(full_path)
+                state[f"{section}/{path}"] = entry
+    return state
+
+
+def read_manifest(archive: Path) -> dict:
+    try:
+        with tarfile.open(archive, "r:*") as tar:
+            member = tar.next()
+            if not member or member.name != MANIFEST:
+                raise CacheError(f"{archive} doesn't start with a {MANIFEST}")
+            manifest = json.load(tar.extractfile(member))
+    except (OSError, tarfile.TarError, ValueError) as error:
+        raise CacheError(f"Couldn't read {archive}: {error}") from error
+
+    if manifest.get("format", 0) > FORMAT:
+        raise CacheError(f"{archive} has format {manifest['format']}, this version reads up to {FORMAT}")
+    return manifest
+
+
+def export(archive: Path, base: Path = None, roots: Dict[str, Path] = None) -> dict:
+    """
+    Writes a snapshot of `roots` to `archive`. With `base`, only changes since that archive are written.
+    """
+    roots = roots or sections()
+    base_manifest = read_manifest(base) if base else None
+    base_state = base_manifest["state"] if base_manifest else {}
+    state = scan(roots, base_state)
+
+    changed = [
+        name
+        for name, entry in state.items()
+        if name not in base_state or snapshot_id({name: entry}) != snapshot_id({name: base_state[name]})
+    ]
+    manifest = {
+        "format": FORMAT,
+        "id": snapshot_id(state),
+        "base": base_manifest["id"] if base_manifest else None,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": host(),
+        "state": state,
+        "files": changed,
+        "deleted": sorted(set(base_state) - set(state)),
+    }
+
+    archive.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile(dir=archive.parent, prefix=f".{archive.name}.", delete=False) as temp:
+        try:
+            with tarfile.open(fileobj=temp, mode="w:gz") as tar:
+                data = json.dumps(manifest).encode()
+                info = tarfile.TarInfo(MANIFEST)
+                info.size = len(data)
+                info.mtime = int(datetime.now().timestamp())
+                tar.addfile(info, io.BytesIO(data))
+
+                for name in changed:
+                    section, path = name.split("/", 1)
+                    tar.add(roots[section].joinpath(path), arcname=name, recursive=False)
+        except BaseException:
+            os.unlink(temp.name)
+            raise
+    os.replace(temp.name, archive)
+    Path(f"{archive}.sha256").write_text(f"{checksum(archive)}  {archive.name}\n")
+
+    logger.info(
+        f"Exported {len(changed)} of {len(state)} files to {archive}"
+        + (f" as a delta of {base}, {len(manifest['deleted'])} deleted" if base else "")
+    )
+    return manifest
+
+
+def installed(roots: Dict[str, Path] = None) -> Optional[str]:
+    """
+    The id of the snapshot last imported into `roots`.
+    """
+    state_file = (roots or sections())["platformio"].joinpath(STATE_FILE)
+    try:
+        return json.loads(state_file.read_text())["id"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _target(roots: Dict[str, Path], name: str) -> Path:
+    path = PurePosixPath(name)
+    if path.is_absolute() or ".." in path.parts or len(path.parts) < 2 or path.parts[0] not in roots:
+        raise CacheError(f"Refusing to extract {name}")
+    return roots[path.parts[0]].joinpath(*path.parts[1:])
+
+
+def _extract_file(tar: tarfile.TarFile, member: tarfile.TarInfo, entry: dict, target: Path):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    with NamedTemporaryFile(dir=target.parent, prefix=f".{target.name}.", delete=False) as temp:
+        try:
+            source = tar.extractfile(member)
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                temp.write(chunk)
+            if digest.hexdigest() != entry["sha256"]:
+                raise CacheError(f"Checksum mismatch for {member.name}")
+            os.chmod(temp.name, entry["mode"])
+        except BaseException:
+            os.unlink(temp.name)
+            raise
+    os.utime(temp.name, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+    os.replace(temp.name, target)
+
+
+def _remove(target: Path):
+    if target.is_symlink() or target.is_file():
+        target.unlink()
+    elif target.is_dir():
+        shutil.rmtree(target)
+
+
+def import_archive(archive: Path, roots: Dict[str, Path] = None, force: bool = False) -> dict:
+    """
+    Unpacks a snapshot or a delta into `roots`. Files are only moved into place after their checksum matched.
+    """
+    roots = roots or sections()
+    sidecar = Path(f"{archive}.sha256")
+    if sidecar.exists() and sidecar.read_text().split()[0] != checksum(archive):
+        raise CacheError(f"Checksum mismatch for {archive}")
+
+    manifest = read_manifest(archive)
+    if manifest["host"] != host() and not force:
+        raise CacheError(f"{archive} was made on {manifest['host']}, this host is {host()}")
+    current = installed(roots)
+    if manifest["base"] and manifest["base"] != current and not force:
+        raise CacheError(f"{archive} is a delta of snapshot {manifest['base']}, installed is {current}")
+
+    state, expected = manifest["state"], set(manifest["files"])
+    with tarfile.open(archive, "r:*") as tar:
+        for member in tar:
+            if member.name == MANIFEST:
+                continue
+            if member.name not in expected:
+                raise CacheError(f"Unexpected file in {archive}: {member.name}")
+            target, entry = _target(roots, member.name), state[member.name]
+            if member.issym():
+                if member.linkname != entry.get("link"):
+                    raise CacheError(f"Checksum mismatch for {member.name}")
+                target.parent.mkdir(parents=True, exist_ok=True)
+                _remove(target)
+                os.symlink(member.linkname, target)
+            elif member.isfile():
+                if target.is_symlink() or target.is_dir():
+                    _remove(target)
+                _extract_file(tar, member, entry, target)
+            else:
+                raise CacheError(f"Unsupported file type in {archive}: {member.name}")
+            expected.discard(member.name)
+
+    if expected:
+        raise CacheError(f"{archive} is missing {len(expected)} files, for example {sorted(expected)[0]}")
+    for name in manifest["deleted"]:
+        _remove(_target(roots, name))
+
+    roots["platformio"].mkdir(parents=True, exist_ok=True)
+    roots["platformio"].joinpath(STATE_FILE).write_text(
+        json.dumps({"id": manifest["id"], "archive": archive.name, "imported": datetime.now().isoformat()})
+    )
+    logger.info(f"Imported {len(manifest['files'])} files from {archive}, {len(manifest['deleted'])} deleted")
+    return manifest
+
+
+def main(argv: Iterable[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m wbld.cache", description="Export and import cache snapshots.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write a snapshot of the caches")
+    export_parser.add_argument("archive", type=Path)
+    export_parser.add_argument("--base", type=Path, help="only write changes since this archive")
+    import_parser = commands.add_parser("import", help="unpack snapshots and deltas in order")
+    import_parser.add_argument("archives", type=Path, nargs="+")
+    import_parser.add_argument("--force", action="store_true", help="skip the platform and base snapshot checks")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "export":
+            export(args.archive, base=args.base)
+        else:
+            for archive in args.archives:
+                import_archive(archive, force=args.force)
+    except CacheError as error:
+        logger.error(str(error))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,27 @@
+from asyncio import gather, get_running_loop, Semaphore, sleep
 from asyncio.exceptions import TimeoutError
 from configparser import MissingSectionHeaderError, ParsingError
+from time import monotonic
+from typing import Optional
 
-from discord import File, Embed, Colour
+from discord import File, Embed, Colour, HTTPException
 from discord.ext import commands
+import humanize
 
-from wbld.build import Builder, BuilderCustom
+from wbld.build import builder_class, Manager
+from wbld.build.analytics import BuildAnalytics
 from wbld.build.config import CustomConfigException
-from wbld.build.models import BuildModel
-from wbld.build.enums import State
+from wbld.build.models import Author, BuildModel
+from wbld.build.enums import Kind, State
+from wbld.build.index import BuildIndex
+from wbld.build.journal import Job, JobState, Journal, LOST_CONTACT
+from wbld.build.runner import Runner
+from wbld.build.scheduler import Scheduler
 from wbld.log import logger
 from wbld.repository import Reference, ReferenceException, Clone
+from wbld.status import Status, StatusUpdater
+
+MESSAGE_LIMIT = 2000
 
 
 class WbldEmbed(Embed):
@@ -30,59 +42,230 @@ class WbldEmbed(Embed):
             self.colour = Colour.red()
             self.title = f"Build Failed: {build.build_id}"
             self.add_field(name="log", value=f"[combined.txt]({base_url}/data/{build.build_id}/combined.txt)")
+        elif build.state == State.CANCELLED:
+            self.colour = Colour.orange()
+            self.title = f"Build Cancelled: {build.build_id}"
         else:
             self.add_field(name="version", value=build.version)
             self.add_field(name="commit", value=f"[{build.sha1}](https://github.com/Aircoookie/WLED/commit/{build.sha1})")
 
+        if build.reason:
+            self.add_field(name="reason", value=build.reason, inline=False)
+
 
 class WbldCog(commands.Cog, name="Builder"):
     """
     Commands to build and work with WLED firmware.
     """
 
-    def __init__(self, bot, base_url: str, default_branch: str):
+    remote_poll_interval = 2.0
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, bot, base_url: str, default_branch: str, concurrency: int = 2, remote: bool = False):
         self.bot = bot
         self.base_url = base_url
         self.default_branch = default_branch
+        self.concurrency = concurrency
+        Scheduler.concurrency = concurrency
+        self.status = StatusUpdater()
+        self.remote = remote
+        self._resumed = False
+        self._slots = None
+
+    @property
+    def slots(self) -> Semaphore:
+        # Created on first use, a semaphore binds to the event loop running when it's made on Python < 3.10.
+        if self._slots is None:
+            self._slots = Semaphore(self.concurrency)
+        return self._slots
+
+    async def _build_firmware(self, ctx: commands.Context, version, env_or_snippet, job: Job, clone=None):
+        if job.remote:
+            if clone:
+                clone.cleanup()
+            await self._wait_remote(ctx, version, job)
+            return
+
+        with Journal.track(job):
+            status = await self.status.create(ctx, f"Build of `{version}` is queued. Waiting for a free build slot.")
+            try:
+                async with self.slots:
+                    if not clone:
+                        status.update(f"Cloning `{version}`.")
+                        clone = Clone(version)
+                        clone.clone_version()
+
+                    status.update(f"Preparing the PlatformIO environment for `{version}`.")
+                    with builder_class(job.kind)(clone, env_or_snippet) as build:
+                        Journal.start(job.id, build.build.build_id)
+                        build.build.author = ctx.author
+                        estimate = await get_running_loop().run_in_executor(
+                            None, BuildAnalytics.estimate, build.build.env, build.build.platform
+                        )
+                        started = monotonic()
+                        self._update_status(status, ctx, build.build, "Compiling." + self._eta(estimate, 0.0))
+
+                        def progress(compiled, expected):
+                            if expected:
+                                percent = min(99, 100 * compiled // expected)
+                                phase = f"Compiling: {percent}% ({compiled}/{expected} files)."
+                            else:
+                                phase = f"Compiling: {compiled} files."
+                            fraction = min(1.0, compiled / expected) if expected else None
+                            phase += self._eta(estimate, monotonic() - started, fraction)
+                            self._update_status(status, ctx, build.build, phase)
+
+                        await Runner(build, progress=progress, started=lambda pgid: Journal.attach(job.id, pgid)).run()
+                        await self._send_result(ctx, version, build.build, status)
+            except ReferenceException as error:
+                status.update(f"Build of `{version}` failed.")
+                await ctx.send(f"{error}: {version}")
+            except (
+                CustomConfigException,
+                MissingSectionHeaderError,
+                ParsingError,
+            ) as error:
+                status.update(f"Build of `{version}` failed.")
+                await ctx.send(
+                    content=f"Config Errror:\n\n{error}\n\nCheck your configuration and see help using: `{ctx.prefix}help`"
+                )
 
-    async def _build_firmware(self, ctx: commands.Context, version, env_or_snippet, builder, clone=None):
-        try:
-            if not clone:
-                clone = Clone(version)
-                clone.clone_version()
+    async def _wait_remote(self, ctx: commands.Context, version, job: Job):
+        """
+        Waits for a build worker to pick up and finish a remote job, updating the status once it started.
+        """
+        status = await self.status.create(ctx, f"Build of `{version}` is queued. Waiting for a build worker.")
+        build = None
+        while job.state != JobState.DONE:
+            await sleep(self.remote_poll_interval)
+            job = await get_running_loop().run_in_executor(None, Journal.get, job.id)
+            # A worker which took over the job from another one starts a new build.
+            if job.build_id and (not build or build.build_id != job.build_id):
+                build = BuildModel.parse_build_id(job.build_id)
+                estimate = await get_running_loop().run_in_executor(
+                    None, BuildAnalytics.estimate, build.env, build.platform
+                )
+                self._update_status(status, ctx, build, f"Compiling on `{job.worker}`." + self._eta(estimate, 0.0))
+
+        if job.error:
+            if job.build_id:
+                Manager.fail_build(job.build_id, job.error)
+            status.update(f"Build of `{version}` failed.")
+            await ctx.send(f"Sorry, {ctx.author.mention}. There was a problem building: {job.error}")
+            return
 
-            with builder(clone, env_or_snippet) as build:
+        build = Manager.fail_build(job.build_id, LOST_CONTACT)
+        await self._send_result(ctx, version, build, status)
+
+    @staticmethod
+    def _eta(estimate: Optional[float], elapsed: float, fraction: float = None) -> str:
+        remaining = BuildAnalytics.remaining(estimate, elapsed, fraction)
+        if remaining is None:
+            return ""
+        if remaining < 10:
+            return " Almost done."
+        return f" About {humanize.naturaldelta(remaining)} left."
+
+    def _update_status(self, status: Status, ctx: commands.Context, build: BuildModel, phase: str):
+        status.update(
+            f"Sure thing. Building env `{build.env}` as `{build.build_id}`. {phase}",
+            embed=WbldEmbed(ctx, build, self.base_url),
+        )
+
+    async def _send_result(self, ctx: commands.Context, version, build: BuildModel, status: Status):
+        if build.state == State.SUCCESS:
+            self._update_status(status, ctx, build, "Uploading firmware.")
+            with build.file_binary.open("rb") as binary:
+                dfile = File(binary, filename=f"wled_{build.env}_{version}_{build.build_id}.bin")
                 await ctx.send(
-                    f"Sure thing. Building env `{build.build.env}` as `{build.build.build_id}`. This will take a moment.",
-                    embed=WbldEmbed(ctx, build.build, self.base_url),
+                    embed=WbldEmbed(ctx, build, self.base_url),
+                    file=dfile,
+                    content=f"Good news, {ctx.author.mention}! Your build `{build.build_id}` for `{build.env}` has succeeded.",  # noqa: E501
                 )
-                build.build.author = ctx.author
-                run = await self.bot.loop.run_in_executor(None, build.run)
-
-                if run and build.build.state == State.SUCCESS:
-                    with build.build.file_binary.open("rb") as binary:
-                        dfile = File(binary, filename=f"wled_{build.build.env}_{version}_{build.build.build_id}.bin")
-                        await ctx.send(
-                            embed=WbldEmbed(ctx, build.build, self.base_url),
-                            file=dfile,
-                            content=f"Good news, {ctx.author.mention}! Your build `{build.build.build_id}` for `{build.build.env}` has succeeded.",  # noqa: E501
-                        )
-                else:
-                    await ctx.send(
-                        embed=WbldEmbed(ctx, build.build, self.base_url),
-                        content=f"Sorry, {ctx.author.mention}. There was a problem building. See logs with: `{ctx.prefix}build log {build.build.build_id}`",  # noqa: E501
-                    )
-                    logger.error(f"Error building firmware for `{build.build.env}` against `{version}`.")
-        except ReferenceException as error:
-            await ctx.send(f"{error}: {version}")
-        except (
-            CustomConfigException,
-            MissingSectionHeaderError,
-            ParsingError,
-        ) as error:
+            self._update_status(status, ctx, build, "Done.")
+        elif build.state == State.CANCELLED:
+            self._update_status(status, ctx, build, "Cancelled.")
             await ctx.send(
-                content=f"Config Errror:\n\n{error}\n\nCheck your configuration and see help using: `{ctx.prefix}help`"
+                embed=WbldEmbed(ctx, build, self.base_url),
+                content=f"{ctx.author.mention}, your build `{build.build_id}` was cancelled.",
             )
+        else:
+            self._update_status(status, ctx, build, "Failed.")
+            await ctx.send(
+                embed=WbldEmbed(ctx, build, self.base_url),
+                content=f"Sorry, {ctx.author.mention}. There was a problem building. See logs with: `{ctx.prefix}build log {build.build_id}`",  # noqa: E501
+            )
+            logger.error(f"Error building firmware for `{build.env}` against `{version}`.")
+
+    def _failure_message(self, build: BuildModel) -> str:
+        """
+        The relevant lines of a failed build's log, cut to fit in a Discord message.
+        """
+        footer = f"Full log: {self.base_url}/data/{build.build_id}/combined.txt"
+        if build.failure.signature:
+            entries, _ = BuildIndex.query(failure=build.failure.signature, limit=None)
+            others = len([entry for entry in entries if entry.build_id != build.build_id])
+            if others:
+                footer = f"{others} other builds failed the same way. {footer}"
+
+        header = f"Build `{build.build_id}` for `{build.env}` failed:\n```\n"
+        budget = MESSAGE_LIMIT - len(header) - len(footer) - len("\n```\n") - len("…\n")
+        lines = []
+        for line in build.failure.lines:
+            budget -= len(line) + 1
+            if budget < 0:
+                lines.append("…")
+                break
+            lines.append(line)
+        return header + "\n".join(lines) + "\n```\n" + footer
+
+    def _enqueue(self, ctx: commands.Context, kind: Kind, version, env_or_snippet) -> Job:
+        return Journal.enqueue(
+            kind=kind,
+            version=version,
+            payload=env_or_snippet,
+            channel_id=ctx.channel.id,
+            message_id=ctx.message.id,
+            author_id=ctx.author.id,
+            author=Author.validate(ctx.author),
+            remote=self.remote,
+        )
+
+    async def _resume(self, job: Job):
+        if job.pgid and not job.remote:
+            # Outside of containers the build outlives the bot and would overwrite the build after it's resumed.
+            Runner.kill_stale(job.pgid)
+        if job.build_id and not job.remote:
+            try:
+                build = BuildModel.parse_build_id(job.build_id)
+            except FileNotFoundError:
+                pass
+            else:
+                if not build.finished:
+                    build.reason = "Interrupted by a restart"
+                    build.state = State.FAILED
+                    build.sealed = True
+
+        channel = self.bot.get_channel(job.channel_id)
+        try:
+            message = await channel.fetch_message(job.message_id)
+        except (AttributeError, HTTPException):
+            logger.warning(f"Dropping job {job.id}: can't find message {job.message_id} in {job.channel_id}")
+            Journal.finish(job.id)
+            return
+
+        ctx = await self.bot.get_context(message)
+        if job.remote:
+            await self._build_firmware(ctx, job.version, job.payload, job)
+            return
+
+        if job.attempts >= Journal.max_attempts:
+            await ctx.send(f"Sorry, {ctx.author.mention}. Your build was interrupted by a restart and couldn't finish.")
+            Journal.finish(job.id)
+            return
+
+        await ctx.send(f"{ctx.author.mention}, the bot restarted before your build finished. Building it again now.")
+        await self._build_firmware(ctx, job.version, job.payload, job)
 
     @staticmethod
     async def _get_reference(ctx, version):
@@ -132,6 +315,21 @@ class WbldCog(commands.Cog, name="Builder"):
         await logger.complete()
         raise exception
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if self._resumed:
+            return
+        self._resumed = True
+
+        jobs = Journal.unfinished()
+        if jobs:
+            logger.info(f"Resuming {len(jobs)} interrupted builds")
+        results = await gather(*[self._resume(job) for job in jobs], return_exceptions=True)
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.opt(exception=result).error(f"Couldn't resume job {job.id}")
+                Journal.finish(job.id, error=str(result))
+
     @commands.Cog.listener()
     async def on_command(self, ctx):
         logger.debug(f"Command {ctx.command.qualified_name} called by {str(ctx.author)}")
@@ -166,7 +364,8 @@ class WbldCog(commands.Cog, name="Builder"):
         if not version:
             version = self.default_branch
 
-        await self._build_firmware(ctx, version, env, Builder)
+        job = self._enqueue(ctx, Kind.BUILTIN, version, env)
+        await self._build_firmware(ctx, version, env, job)
 
     @commands.max_concurrency(1, per=commands.BucketType.user)
     @build.command()
@@ -213,12 +412,14 @@ class WbldCog(commands.Cog, name="Builder"):
             except TimeoutError:
                 await ctx.send("Didn't receive configuraton within 30 seconds. Try again!")
             else:
-                await self._build_firmware(ctx, version, msg.content, BuilderCustom, clone=clone)
+                job = self._enqueue(ctx, Kind.CUSTOM, version, msg.content)
+                await self._build_firmware(ctx, version, msg.content, job, clone=clone)
 
     @build.command()
     async def log(self, ctx, build_id):
         """
-        Returns the log file containing stdout and stderr of the PlatformIO build.
+        Returns the log file containing stdout and stderr of the PlatformIO build. For failed builds, replies with the
+        errors found in the log instead.
         """
 
         try:
@@ -229,5 +430,88 @@ class WbldCog(commands.Cog, name="Builder"):
                 "error before we could write logs. "
             )
         else:
+            if build.failure and build.failure.lines:
+                # Counting the builds which failed the same way reads the build index.
+                await ctx.send(await get_running_loop().run_in_executor(None, self._failure_message, build))
+                return
             file_send = File(build.file_log, filename=f"wled_build_{build_id}.log")
             await ctx.send(file=file_send, content=f"Log file for build: `{build_id}`")
+
+    @build.command()
+    async def cancel(self, ctx, build_id):
+        """
+        Cancels a running build. Only the author of the build or members who can manage messages may cancel it.
+        """
+
+        try:
+            build = BuildModel.parse_build_id(build_id)
+        except FileNotFoundError:
+            await ctx.send(f"Couldn't find build: `{build_id}`.")
+            return
+
+        is_author = build.author and build.author["id"] == str(ctx.author.id)
+        permissions = getattr(ctx.author, "guild_permissions", None)
+        if not is_author and not (permissions and permissions.manage_messages):
+            await ctx.send(f"Sorry, {ctx.author.mention}. You can only cancel your own builds.")
+        elif build.finished:
+            await ctx.send(f"Build `{build_id}` has already finished.")
+        else:
+            Manager.cancel_build(build_id, reason=f"Cancelled by {ctx.author}")
+            Runner.cancel(build_id)
+            await ctx.send(f"Cancelling build `{build_id}`.")
+
+    @staticmethod
+    def _stats_line(name: str, stats: dict) -> str:
+        def percent(rate):
+            return "-" if rate is None else f"{rate:.0%}"
+
+        def duration(seconds):
+            return "-" if seconds is None else humanize.precisedelta(seconds, format="%0.0f")
+
+        return (
+            f"{name}: {stats['builds']} builds, {percent(stats['failure_rate'])} failed, "
+            f"median {duration(stats['duration']['p50'])}, p90 {duration(stats['duration']['p90'])}, "
+            f"{percent(stats['cache_hit_rate'])} cache hits"
+        )
+
+    @build.command()
+    async def stats(self, ctx, env=None):
+        """
+        Shows how long builds take, how often they fail and hit the build cache per env, the busiest hours and who
+        builds the most. With an env, shows the statistics of that env only.
+
+        Example:
+
+          ./build stats d1_mini
+        """
+
+        # Refreshing the statistics reads every build that changed since the last time.
+        loop = get_running_loop()
+        footer = f"More at {self.base_url}/stats"
+        if env:
+            stats = await loop.run_in_executor(None, BuildAnalytics.env_summary, env)
+            if not stats:
+                await ctx.send(f"No finished builds of `{env}` yet.")
+            else:
+                await ctx.send(f"{self._stats_line(f'`{env}`', stats)}\n{footer}")
+            return
+
+        summary = await loop.run_in_executor(None, BuildAnalytics.summary, 5)
+        if not summary["builds"]:
+            await ctx.send("No finished builds yet.")
+            return
+
+        hours = sorted(range(24), key=lambda hour: summary["hours"][hour], reverse=True)[:3]
+        lines = [
+            self._stats_line("All builds", summary),
+            "",
+            "Most built envs:",
+            *["- " + self._stats_line(f"`{group['name']}`", group) for group in summary["envs"]],
+            "",
+            "Busiest hours (UTC): "
+            + ", ".join(f"{hour:02}:00 ({summary['hours'][hour]})" for hour in hours if summary["hours"][hour]),
+            "Top requesters: "
+            + ", ".join(f"{requester['name']} ({requester['builds']})" for requester in summary["requesters"]),
+            footer,
+        ]
+        await ctx.send("\n".join(lines)[:MESSAGE_LIMIT])
@@ -0,0 +1,120 @@
+import asyncio
+import hmac
+import os
+
+from aiohttp import web
+
+from wbld.build.enums import State
+from wbld.build import Manager
+from wbld.build.journal import Journal, LOST_CONTACT
+from wbld.build.models import BuildModel
+from wbld.build.storage import Storage
+from wbld.build.triage import analyze
+from wbld.log import logger
+
+API_TOKEN = os.getenv("API_TOKEN")
+LEASE = float(os.getenv("WORKER_LEASE", "60"))
+
+routes = web.RouteTableDef()
+
+
+def authorize(request: web.Request):
+    # Without a token nobody may claim jobs or upload firmware.
+    if not API_TOKEN or not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {API_TOKEN}"):
+        raise web.HTTPUnauthorized()
+
+
+def renew(request: web.Request, build_id: str = None):
+    job_id = request.match_info["job_id"]
+    if not Journal.renew(job_id, request.query.get("worker"), LEASE, build_id=build_id):
+        raise web.HTTPConflict(text=f"Job {job_id} is not leased to this worker")
+    return Journal.get(job_id)
+
+
+def fail_build(build_id: str, reason: str):
+    try:
+        Manager.fail_build(build_id, reason)
+    except FileNotFoundError:
+        logger.warning(f"Build {build_id} of a remote job is gone")
+
+
+def build_path(build_id: str):
+    path = Storage.base_path.joinpath(build_id)
+    if path.parent != Storage.base_path:
+        raise web.HTTPBadRequest(text=f"Invalid build: {build_id}")
+    return path
+
+
+@routes.post("/api/jobs/claim")
+async def claim(request):
+    authorize(request)
+    job = Journal.claim(request.query.get("worker"), LEASE, abandon=lambda build_id: fail_build(build_id, LOST_CONTACT))
+    if not job:
+        return web.Response(status=204)
+
+    logger.info(f"Job {job.id} claimed by {job.worker}")
+    return web.json_response(text=job.json())
+
+
+@routes.post("/api/jobs/{job_id}/start")
+async def start(request):
+    authorize(request)
+    data = await request.json()
+    path = build_path(data["build_id"])
+    job = renew(request, build_id=path.name)
+
+    path.mkdir(parents=True, exist_ok=True)
+    build = BuildModel.parse_obj({**data["build"], "path": path, "author": job.author})
+    build.write()
+    return web.json_response({"build_id": build.build_id})
+
+
+@routes.post("/api/jobs/{job_id}/log")
+async def log(request):
+    authorize(request)
+    job = renew(request)
+    build = BuildModel.parse_build_id(job.build_id)
+
+    with build.file_log.open("ab") as log_file:
+        async for chunk in request.content.iter_any():
+            log_file.write(chunk)
+
+    cancel = build.file_cancel.read_text() if build.file_cancel.exists() else None
+    return web.json_response({"cancel": cancel})
+
+
+@routes.put("/api/jobs/{job_id}/firmware")
+async def firmware(request):
+    authorize(request)
+    job = renew(request)
+    build = BuildModel.parse_build_id(job.build_id)
+
+    with build.file_binary.open("wb") as binary:
+        async for chunk in request.content.iter_any():
+            binary.write(chunk)
+
+    return web.Response(status=204)
+
+
+@routes.post("/api/jobs/{job_id}/complete")
+async def complete(request):
+    authorize(request)
+    data = await request.json()
+    job = renew(request)
+
+    if job.build_id and data.get("build"):
+        build = BuildModel.parse_build_id(job.build_id)
+        for field in ("duration", "jobs", "objects_cached", "objects_compiled", "reason"):
+            setattr(build, field, data["build"].get(field))
+        build.state = State(data["build"]["state"])
+        if build.state == State.FAILED and build.file_log.exists():
+            # Triaged from the log streamed to us rather than trusting the worker's copy.
+            build.failure = await asyncio.get_running_loop().run_in_executor(None, analyze, build.file_log)
+        build.sealed = True
+    elif job.build_id:
+        # The worker gave up after starting the build.
+        fail_build(job.build_id, data.get("error") or "The build worker gave up")
+
+    Journal.finish(job.id, error=data.get("error"))
+    logger.info(f"Job {job.id} completed by {job.worker}")
+    return web.Response(status=204)
@@ -0,0 +1,213 @@
+"""
+Event loop diagnostics for the bot and web processes.
+
+With `DIAGNOSTICS=1` a heartbeat task measures how late the event loop wakes it up, and a watchdog thread takes the
+stack of the loop thread whenever the heartbeat is overdue by more than `DIAGNOSTICS_THRESHOLD` seconds. That stack
+shows the callback that blocks the loop while it's still blocking. Stalls are logged and both lag and stalls are
+served as JSON from `/debug/loop` and in the Prometheus text format from `/debug/metrics`.
+"""
+import asyncio
+from collections import Counter, deque
+from datetime import datetime
+import os
+from pathlib import Path
+import sys
+import threading
+from time import monotonic
+import traceback
+from typing import Deque, List, Optional
+
+from aiohttp import web
+
+from wbld.coordinator import API_TOKEN, authorize
+from wbld.log import logger
+
+DIAGNOSTICS = os.getenv("DIAGNOSTICS", "0").lower() in ("1", "true", "yes")
+DIAGNOSTICS_HOST = os.getenv("DIAGNOSTICS_HOST", "127.0.0.1")
+DIAGNOSTICS_PORT = int(os.getenv("DIAGNOSTICS_PORT", "8091"))
+DIAGNOSTICS_THRESHOLD = float(os.getenv("DIAGNOSTICS_THRESHOLD", "0.1"))
+
+ROOT = Path(__file__).parent.parent
+
+routes = web.RouteTableDef()
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))]
+
+
+class LoopMonitor:
+    """
+    Measures event loop lag and captures the stack of callbacks blocking the loop for longer than `threshold` seconds.
+
+    Lag samples of the last `history` heartbeats are kept for percentiles, totals are kept since the start. Stalls are
+    counted per location, the innermost frame of wbld code in the captured stack.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = DIAGNOSTICS_THRESHOLD, history: int = 600):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: Deque[float] = deque(maxlen=history)
+        self.lag_count = 0
+        self.lag_sum = 0.0
+        self.lag_max = 0.0
+        self.stalls: Deque[dict] = deque(maxlen=20)
+        self.locations: Counter = Counter()
+        self.beat = monotonic()
+        self.stall: Optional[dict] = None
+        self.lock = threading.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.thread: Optional[threading.Thread] = None
+        self.thread_id: Optional[int] = None
+        self.stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        """
+        Starts monitoring the running event loop. Must be called from the loop thread.
+        """
+        if self.running:
+            return
+        self.thread_id = threading.get_ident()
+        self.beat = monotonic()
+        self.stopped.clear()
+        self.task = asyncio.ensure_future(self._heartbeat())
+        self.thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.thread.start()
+        logger.info(f"Monitoring event loop lag, reporting stalls over {self.threshold}s")
+
+    def stop(self):
+        self.stopped.set()
+        if self.task:
+            self.task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            start = monotonic()
+            self.beat = start
+            await asyncio.sleep(self.interval)
+            now = monotonic()
+            lag = max(0.0, now - start - self.interval)
+            self.beat = now
+
+            self.lags.append(lag)
+            self.lag_count += 1
+            self.lag_sum += lag
+            self.lag_max = max(self.lag_max, lag)
+
+            with self.lock:
+                stall, self.stall = self.stall, None
+            if stall:
+                stall["blocked"] = round(lag, 3)
+                logger.warning(f"Event loop was blocked for {lag:.3f}s in {stall['location']}")
+
+    def _watch(self):
+        while not self.stopped.wait(self.threshold / 2):
+            overdue = monotonic() - self.beat - self.interval
+            if overdue < self.threshold:
+                continue
+            with self.lock:
+                if self.stall:
+                    continue
+                frame = sys._current_frames().get(self.thread_id)  # pylint: disable=protected-access
+                if frame is None:
+                    continue
+                self.stall = self._capture(frame)
+                stall = self.stall
+            logger.warning(
+                f"Event loop blocked for more than {self.threshold}s in {stall['location']}:\n"
+                + "".join(stall["stack"])
+            )
+
+    def _capture(self, frame) -> dict:
+        summary = traceback.extract_stack(frame)
+        location = f"{summary[-1].filename}:{summary[-1].lineno} {summary[-1].name}"
+        for entry in reversed(summary):
+            path = Path(entry.filename)
+            if ROOT in path.parents and "site-packages" not in path.parts:
+                location = f"{path.relative_to(ROOT)}:{entry.lineno} {entry.name}"
+                break
+
+        self.locations[location] += 1
+        stall = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "location": location,
+            "blocked": None,
+            "stack": traceback.format_list(summary),
+        }
+        self.stalls.append(stall)
+        return stall
+
+    def snapshot(self) -> dict:
+        lags = list(self.lags)
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "lag": {
+                "p50": percentile(lags, 50),
+                "p99": percentile(lags, 99),
+                "max": max(lags, default=0.0),
+                "max_total": self.lag_max,
+                "count": self.lag_count,
+                "sum": self.lag_sum,
+            },
+            "stalls": dict(self.locations),
+            "recent": list(self.stalls),
+        }
+
+    def metrics(self) -> str:
+        lags = list(self.lags)
+        lines = [
+            "# HELP wbld_loop_lag_seconds How late the event loop ran the heartbeat.",
+            "# TYPE wbld_loop_lag_seconds summary",
+            f'wbld_loop_lag_seconds{{quantile="0.5"}} {percentile(lags, 50)}',
+            f'wbld_loop_lag_seconds{{quantile="0.99"}} {percentile(lags, 99)}',
+            f"wbld_loop_lag_seconds_sum {self.lag_sum}",
+            f"wbld_loop_lag_seconds_count {self.lag_count}",
+            "# HELP wbld_loop_lag_max_seconds Highest event loop lag since the start.",
+            "# TYPE wbld_loop_lag_max_seconds gauge",
+            f"wbld_loop_lag_max_seconds {self.lag_max}",
+            "# HELP wbld_loop_stalls_total Callbacks that blocked the event loop longer than the threshold.",
+            "# TYPE wbld_loop_stalls_total counter",
+        ]
+        for location, count in self.locations.items():
+            lines.append(f'wbld_loop_stalls_total{{location="{location}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+monitor = LoopMonitor()
+
+
+@routes.get("/debug/loop")
+async def loop_snapshot(request):
+    if API_TOKEN:
+        authorize(request)
+    return web.json_response(monitor.snapshot())
+
+
+@routes.get("/debug/metrics")
+async def loop_metrics(request):
+    if API_TOKEN:
+        authorize(request)
+    return web.Response(text=monitor.metrics(), content_type="text/plain")
+
+
+async def serve(host: str = DIAGNOSTICS_HOST, port: int = DIAGNOSTICS_PORT) -> web.AppRunner:
+    """
+    Starts monitoring and serves the debug endpoints for processes without their own web server.
+    """
+    monitor.start()
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving diagnostics on http://{host}:{port}/debug/loop")
+    return runner
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime
+import hashlib
+from time import monotonic
+from typing import Any, NamedTuple, Optional, Tuple
+
+from aiohttp import web
+
+from wbld.api import not_modified
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class Page(NamedTuple):
+    body: bytes
+    etag: str
+    modified: float
+    cache_control: str
+
+    def response(self, request: web.Request) -> web.Response:
+        headers = {
+            "Cache-Control": self.cache_control,
+            "ETag": self.etag,
+            "Last-Modified": format_datetime(datetime.fromtimestamp(int(self.modified), timezone.utc), usegmt=True),
+        }
+        if not_modified(request, self.etag, self.modified):
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=self.body, content_type="text/html", charset="utf-8", headers=headers)
+
+
+class PageCache:
+    """
+    Rendered pages by path. A page is served from the cache while the version it was rendered for is current and its
+    time to live hasn't run out. The least recently used pages are dropped beyond `size` pages.
+    """
+
+    def __init__(self, size: int = 1024):
+        self.size = size
+        self.pages: "OrderedDict[str, Tuple[Any, Optional[float], Page]]" = OrderedDict()
+
+    def get(self, key: str, version) -> Optional[Page]:
+        cached = self.pages.get(key)
+        if not cached:
+            return None
+        cached_version, expires, page = cached
+        if cached_version != version or (expires is not None and expires < monotonic()):
+            del self.pages[key]
+            return None
+        self.pages.move_to_end(key)
+        return page
+
+    # pylint: disable=too-many-arguments
+    def put(
+        self, key: str, version, body: str, modified: float, ttl: float = None, cache_control: str = "no-cache"
+    ) -> Page:
+        encoded = body.encode()
+        page = Page(encoded, f'"{hashlib.sha1(encoded).hexdigest()}"', modified, cache_control)
+        self.pages[key] = (version, monotonic() + ttl if ttl is not None else None, page)
+        self.pages.move_to_end(key)
+        while len(self.pages) > self.size:
+            self.pages.popitem(last=False)
+        return page
+
+    def clear(self):
+        self.pages.clear()
@@ -1,9 +1,14 @@
 from tempfile import TemporaryDirectory
 import os
 from pathlib import Path
+import re
+from typing import Iterable, List, Set
 
-from github import Github, GithubException
-from git import Repo
+from wbld.build.enums import State
+from wbld.log import logger
+
+# PyGithub and GitPython are imported where they're used, so importing this module stays cheap for processes which
+# never clone or resolve references.
 
 
 class ReferenceException(Exception):
@@ -14,8 +19,10 @@ class ReferenceException(Exception):
 
 class Reference:
     def __init__(self, reference, repository="Aircoookie/WLED"):
+        from github import Github  # pylint: disable=import-outside-toplevel
+
         self.reference = reference
-        self.github = Github(os.getenv("GITHUB_TOKEN"))
+        self.github = Github(os.getenv("GITHUB_TOKEN"), base_url=os.getenv("GITHUB_API_URL", "https://api.github.com"))
         self.repository = self.github.get_repo(repository)
 
         checks = [self.get_commit, self.get_branch, self.get_tag]
@@ -28,6 +35,8 @@ class Reference:
         return self.commit.sha
 
     def get_commit(self):
+        from github import GithubException  # pylint: disable=import-outside-toplevel
+
         try:
             commit = self.repository.get_commit(self.reference)
         except GithubException:
@@ -36,6 +45,8 @@ class Reference:
             return commit
 
     def get_branch(self):
+        from github import GithubException  # pylint: disable=import-outside-toplevel
+
         try:
             branch = self.repository.get_branch(self.reference)
         except GithubException:
@@ -52,13 +63,29 @@ class Reference:
 
 
 class Clone:
-    def __init__(self, version, url="https://github.com/Aircoookie/WLED.git"):
+    """
+    A checkout of `version` in a temporary directory.
+
+    With `CLONE_SPARSE=1` the clone is partial and sparse: blobs are fetched only for the files checked out, and only
+    the top-level files plus the directories PlatformIO reads are checked out. Those are `profile` and every directory
+    the PlatformIO configuration refers to. If sparse checkout isn't available, or a build still misses files, the
+    full tree is checked out instead.
+    """
+
+    sparse_default = os.getenv("CLONE_SPARSE", "0").lower() in ("1", "true", "yes")
+    profile = ["wled00", "usermods", "lib", "include", "boards"]
+    configs = ["platformio.ini", "platformio_override.ini"]
+
+    def __init__(self, version, url="https://github.com/Aircoookie/WLED.git", sparse: bool = None):
+        from git import Repo  # pylint: disable=import-outside-toplevel
+
         self.tempdir = TemporaryDirectory()
         self.path = Path(self.tempdir.name)
         self.url = url
         self.version = version
         self.repo = Repo.init(str(self.path))
         self.sha1 = None
+        self.sparse = self.sparse_default if sparse is None else sparse
 
     def __enter__(self):
         return self.path
@@ -67,12 +94,115 @@ class Clone:
         self.cleanup()
 
     def clone_version(self):
+        from git import GitCommandError  # pylint: disable=import-outside-toplevel
+
         origin = self.repo.create_remote("origin", self.url)
-        origin.fetch()
-        self.repo.git.checkout(self.version)
+        if self.sparse:
+            try:
+                self._clone_sparse()
+            except GitCommandError as error:
+                logger.warning(f"Sparse checkout of {self.version} failed, checking out everything: {error}")
+                self.expand()
+        else:
+            origin.fetch()
+            self.repo.git.checkout(self.version)
 
         self.sha1 = self.repo.commit()
         return self.sha1
 
+    def _clone_sparse(self):
+        self.repo.git.fetch("--filter=blob:none", "origin")
+        # Cone mode without directories checks out only the files at the top, which includes platformio.ini.
+        self.repo.git.sparse_checkout("init", "--cone")
+        self.repo.git.checkout(self.version)
+        directories = self.sparse_profile()
+        self.repo.git.sparse_checkout("set", *directories)
+        logger.debug(f"Sparse checkout of {self.version} with: {', '.join(directories)}")
+
+    def sparse_profile(self) -> List[str]:
+        """
+        The top-level directories needed to build: `profile` plus those the PlatformIO configuration refers to, for
+        example `src_dir`, `extra_scripts`, `extra_configs` or `board_build.partitions`.
+        """
+        tree = self._tree()
+        directories = {path.split("/")[0] for path in self.referenced_paths(tree)} | set(self.profile)
+        return sorted(directory for directory in directories if f"{directory}/" in tree)
+
+    def _tree(self) -> Set[str]:
+        """
+        Every path at HEAD, directories with a trailing slash. Listing the tree doesn't need any blobs.
+        """
+        paths = set()
+        for line in self.repo.git.ls_tree("-r", "-t", "HEAD").splitlines():
+            info, path = line.split("\t", 1)
+            paths.add(f"{path}/" if info.split()[1] == "tree" else path)
+        return paths
+
+    def referenced_paths(self, tree: Set[str]) -> Set[str]:
+        """
+        Paths in `tree` mentioned anywhere in the PlatformIO configuration files.
+        """
+        paths = set()
+        for config in self.configs:
+            config_path = self.path.joinpath(config)
+            if not config_path.exists():
+                continue
+            for token in re.findall(r"[\w.$/{}-]+", config_path.read_text(errors="replace")):
+                while token.startswith("./"):
+                    token = token[2:]
+                token = token.rstrip("/")
+                if token in tree or f"{token}/" in tree:
+                    paths.add(token)
+        return paths
+
+    def missing_paths(self) -> List[str]:
+        """
+        Paths the PlatformIO configuration refers to which aren't checked out.
+        """
+        if not self.sparse:
+            return []
+        return sorted(path for path in self.referenced_paths(self._tree()) if not self.path.joinpath(path).exists())
+
+    def missing_files(self, names: Iterable[str]) -> List[str]:
+        """
+        The `names` of files in the tree which aren't checked out, matched against the end of their paths. Names of
+        headers from libraries or of unknown packages aren't in the tree, checking out more files doesn't help those.
+        """
+        if not self.sparse:
+            return []
+        files = [path for path in self._tree() if not path.endswith("/")]
+        missing = []
+        for name in names:
+            name = name.strip("/")
+            paths = [path for path in files if path == name or path.endswith(f"/{name}")]
+            if any(not self.path.joinpath(path).exists() for path in paths):
+                missing.append(name)
+        return missing
+
+    def needs_full_checkout(self, build) -> bool:
+        """
+        Whether a failed build might succeed with the full tree checked out. Builds stopped for a reason, like a
+        timeout or the build process crashing, aren't.
+        """
+        if not self.sparse or build.state != State.FAILED or build.reason is not None:
+            return False
+        return bool(self.missing_paths() or (build.failure and self.missing_files(build.failure.missing)))
+
+    def expand(self):
+        """
+        Switches to a full checkout. With a partial clone the missing blobs are fetched on demand.
+        """
+        from git import GitCommandError  # pylint: disable=import-outside-toplevel
+
+        if self.sparse:
+            try:
+                self.repo.git.sparse_checkout("disable")
+            except GitCommandError:
+                pass
+        if not self.repo.head.is_valid():
+            self.repo.remote("origin").fetch()
+            self.repo.git.checkout(self.version)
+        self.sparse = False
+
     def cleanup(self):
         self.tempdir.cleanup()
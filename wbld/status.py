@@ -0,0 +1,85 @@
+import asyncio
+from collections import deque, OrderedDict
+from time import monotonic
+from typing import Deque, Dict
+
+from discord import HTTPException, Message
+
+from wbld.log import logger
+
+
+class Status:
+    """
+    A single status message which is edited in place as a build progresses.
+    """
+
+    def __init__(self, updater: "StatusUpdater", message: Message):
+        self.updater = updater
+        self.message = message
+
+    def update(self, content: str = None, embed=None):
+        fields = {"content": content}
+        if embed:
+            fields["embed"] = embed
+        self.updater.update(self.message, **fields)
+
+
+class StatusUpdater:
+    """
+    Coalesces status message edits per channel.
+
+    Edits are queued per channel and applied by one task per channel which allows at most `rate` edits every `per`
+    seconds. A newer edit for a message that is still waiting replaces the older one, so concurrent builds in the same
+    channel share the budget and only their latest state is sent.
+    """
+
+    def __init__(self, rate: int = 4, per: float = 5.0):
+        self.rate = rate
+        self.per = per
+        self.pending: Dict[int, "OrderedDict[int, tuple]"] = {}
+        self.sent: Dict[int, Deque[float]] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+
+    async def create(self, channel, content: str, **kwargs) -> Status:
+        message = await channel.send(content, **kwargs)
+        self.sent.setdefault(message.channel.id, deque()).append(monotonic())
+        return Status(self, message)
+
+    def update(self, message: Message, **fields):
+        pending = self.pending.setdefault(message.channel.id, OrderedDict())
+        if message.id in pending:
+            fields = {**pending[message.id][1], **fields}
+        pending[message.id] = (message, fields)
+
+        if message.channel.id not in self.tasks:
+            self.tasks[message.channel.id] = asyncio.ensure_future(self._drain(message.channel.id))
+
+    async def flush(self, channel_id: int):
+        task = self.tasks.get(channel_id)
+        if task:
+            await asyncio.shield(task)
+
+    async def _wait_for_budget(self, channel_id: int):
+        sent = self.sent.setdefault(channel_id, deque())
+        while len(sent) >= self.rate:
+            wait = sent[0] + self.per - monotonic()
+            if wait <= 0:
+                sent.popleft()
+            else:
+                await asyncio.sleep(wait)
+
+    async def _drain(self, channel_id: int):
+        pending = self.pending[channel_id]
+        try:
+            while pending:
+                await self._wait_for_budget(channel_id)
+                _, (message, fields) = pending.popitem(last=False)
+                self.sent[channel_id].append(monotonic())
+                try:
+                    await message.edit(**fields)
+                except HTTPException as error:
+                    logger.warning(f"Couldn't update status message {message.id}: {error}")
+        finally:
+            del self.tasks[channel_id]
+            if not pending:
+                del self.pending[channel_id]
@@ -1,16 +1,25 @@
+import hmac
 import json
+import os
 
 from aiohttp import web, WSMsgType, WSMessage
 from jinja2 import FileSystemLoader
 import aiohttp_jinja2
 
+from wbld.api import routes as api_routes
 from wbld.build import Manager, Storage
+from wbld.build.analytics import BuildAnalytics
+from wbld.build.index import BUILD_ID, BuildIndex
+from wbld.coordinator import API_TOKEN, routes as coordinator_routes
+from wbld.diagnostics import DIAGNOSTICS, monitor, routes as diagnostics_routes
 from wbld.log import logger
+from wbld.pages import IMMUTABLE, PageCache
 
-routes = web.RouteTableDef()
-app = web.Application()
+# The build list shows relative times, so it's re-rendered after this many seconds even if no build changed.
+PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "60"))
 
-aiohttp_jinja2.setup(app, loader=FileSystemLoader("wbld/templates"))
+routes = web.RouteTableDef()
+pages = PageCache()
 
 
 @routes.get("/ws")
@@ -48,24 +57,95 @@ async def websocket_handler(request):
 
 
 @routes.get("/")
-@aiohttp_jinja2.template("builds.html.jinja2")
-async def builds(request):  # pylint: disable=unused-argument
-    build_list = Manager.list_builds()  # pylint: disable=redefined-outer-name
-    return {"builds": build_list}
+async def builds(request):
+    BuildIndex.refresh()
+    page = pages.get(request.path, BuildIndex.generation)
+    if not page:
+        entries, _ = BuildIndex.query(limit=None)
+        body = aiohttp_jinja2.render_string(
+            "builds.html.jinja2", request, {"builds": [entry.build for entry in entries]}
+        )
+        modified = max((entry.modified for entry in entries), default=0)
+        page = pages.put(request.path, BuildIndex.generation, body, modified, ttl=PAGE_CACHE_TTL)
+    return page.response(request)
+
+
+@routes.get("/stats")
+async def stats(request):
+    BuildAnalytics.refresh()
+    page = pages.get(request.path, BuildIndex.generation)
+    if not page:
+        body = aiohttp_jinja2.render_string("stats.html.jinja2", request, {"stats": BuildAnalytics.summary(limit=20)})
+        modified = max((entry.modified for entry in BuildIndex.entries.values()), default=0)
+        page = pages.put(request.path, BuildIndex.generation, body, modified)
+    return page.response(request)
 
 
 @routes.get("/build/{uuid}")
-@aiohttp_jinja2.template("build.html.jinja2")
-async def build(request):  # pylint: disable=unused-argument
-    build_info = Manager.get_build(request.match_info["uuid"])
-    return {"build": build_info}
+async def build(request):
+    try:
+        entry = BuildIndex.get(request.match_info["uuid"])
+    except FileNotFoundError as error:
+        raise web.HTTPNotFound() from error
+
+    page = pages.get(request.path, entry.etag)
+    if not page:
+        body = aiohttp_jinja2.render_string(
+            "build.html.jinja2", request, {"build": entry.build, "cancel_enabled": bool(API_TOKEN)}
+        )
+        # Sealed builds don't change anymore, so browsers and proxies may keep their page. Finished builds are still
+        # written to until then, for example with the triaged failure or a retry.
+        cache_control = IMMUTABLE if entry.build.sealed else "no-cache"
+        page = pages.put(request.path, entry.etag, body, entry.modified, cache_control=cache_control)
+    return page.response(request)
+
+
+@routes.post("/build/{uuid}/cancel")
+async def build_cancel(request):
+    # Without a token anyone could cancel anyone's build, so cancelling from the web needs one.
+    data = await request.post()
+    if not API_TOKEN or not hmac.compare_digest(data.get("token", ""), API_TOKEN):
+        raise web.HTTPForbidden(text="Invalid token")
+
+    uuid = request.match_info["uuid"]
+    try:
+        Manager.cancel_build(uuid, reason="Cancelled from web")
+    except FileNotFoundError as error:
+        raise web.HTTPNotFound() from error
+    raise web.HTTPSeeOther(f"/build/{uuid}")
+
+
+async def start_diagnostics(app):  # pylint: disable=unused-argument
+    monitor.start()
+
+
+@routes.get("/data/{build_id}/{name}")
+async def build_file(request):
+    # Only files of builds are served, the storage directory also holds the job journal.
+    build_id, name = request.match_info["build_id"], request.match_info["name"]
+    path = Storage.base_path.joinpath(build_id, name)
+    if not BUILD_ID.match(build_id) or name.startswith(".") or not path.is_file():
+        raise web.HTTPNotFound()
+    return web.FileResponse(path)
 
 
 routes.static("/static", "wbld/static")
-routes.static("/data", Storage.base_path)
 
-if __name__ == "__main__":
-    Storage.create()
+
+def create_app() -> web.Application:
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=FileSystemLoader("wbld/templates"))
     app.add_routes(routes)
+    app.add_routes(api_routes)
+    if API_TOKEN:
+        app.add_routes(coordinator_routes)
     app["websockets"] = []
-    web.run_app(app=app, host="0.0.0.0", port=8090)
+    if DIAGNOSTICS:
+        app.add_routes(diagnostics_routes)
+        app.on_startup.append(start_diagnostics)
+    return app
+
+
+if __name__ == "__main__":
+    Storage.create()
+    web.run_app(app=create_app(), host="0.0.0.0", port=8090)
@@ -0,0 +1,162 @@
+from dotenv import load_dotenv
+import sentry_sdk
+
+sentry_sdk.init()
+
+load_dotenv()
+import asyncio
+import json
+import os
+import shutil
+from pathlib import Path
+import socket
+import sys
+from tempfile import TemporaryDirectory
+
+from aiohttp import ClientError, ClientSession
+import shortuuid
+
+from wbld.build import builder_class
+from wbld.build.enums import State
+from wbld.build.journal import Job
+from wbld.build.runner import Runner
+from wbld.build.scheduler import Scheduler
+from wbld.log import logger
+from wbld.repository import Clone
+
+COORDINATOR_URL = os.getenv("COORDINATOR_URL", "http://localhost:8090")
+API_TOKEN = os.getenv("API_TOKEN")
+WORKER_NAME = os.getenv("WORKER_NAME", socket.gethostname())
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "1"))
+WORKER_DIR = os.getenv("WORKER_DIR")
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class Worker:
+    """
+    Pulls remote jobs from the coordinator, builds them locally and sends the log, firmware and result back.
+
+    Builds are made in `workdir`, a temporary directory by default, and deleted once sent. They're never written to
+    the storage directory, which the coordinator might share when it runs on the same host.
+    """
+
+    poll_interval = 5.0
+    log_interval = 2.0
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, url: str, name: str, token: str = None, concurrency: int = 1, workdir: Path = None):
+        self.url = url.rstrip("/")
+        self.name = name
+        self.token = token
+        self.concurrency = concurrency
+        Scheduler.concurrency = concurrency
+        self.running = False
+        self._tempdir = None if workdir else TemporaryDirectory(prefix="wbld-worker-")
+        self.workdir = Path(workdir or self._tempdir.name)
+
+    async def _request(self, session: ClientSession, method: str, path: str, **kwargs):
+        async with session.request(
+            method, f"{self.url}/api/jobs{path}", params={"worker": self.name}, **kwargs
+        ) as response:
+            if response.status == 409:
+                raise LeaseLost(await response.text())
+            response.raise_for_status()
+            if response.status == 204:
+                return None
+            return await response.json()
+
+    async def claim(self, session: ClientSession) -> Job:
+        data = await self._request(session, "POST", "/claim")
+        return Job.parse_obj(data) if data else None
+
+    @staticmethod
+    def prepare(job: Job, path: Path):
+        clone = Clone(job.version)
+        clone.clone_version()
+        return builder_class(job.kind)(clone, job.payload, path)
+
+    async def _send_log(self, session: ClientSession, job: Job, build, offset: int) -> int:
+        chunk = b""
+        if build.file_log.exists():
+            with build.file_log.open("rb") as log_file:
+                log_file.seek(offset)
+                chunk = log_file.read()
+
+        response = await self._request(session, "POST", f"/{job.id}/log", data=chunk)
+        if response["cancel"] and not build.file_cancel.exists():
+            build.file_cancel.write_text(response["cancel"])
+        return offset + len(chunk)
+
+    async def build(self, session: ClientSession, job: Job, builder):
+        build = builder.build
+        await self._request(
+            session, "POST", f"/{job.id}/start", json={"build_id": build.build_id, "build": json.loads(build.json())}
+        )
+
+        task = asyncio.ensure_future(Runner(builder).run())
+        offset = 0
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=self.log_interval)
+                offset = await self._send_log(session, job, build, offset)
+        except LeaseLost:
+            build.file_cancel.write_text("Lease lost")
+            await task
+            raise
+
+        build = task.result()
+        if build.state == State.SUCCESS:
+            with build.file_binary.open("rb") as binary:
+                await self._request(session, "PUT", f"/{job.id}/firmware", data=binary)
+        await self._request(session, "POST", f"/{job.id}/complete", json={"build": json.loads(build.json())})
+
+    async def process(self, session: ClientSession, job: Job):
+        logger.info(f"Building job {job.id}: {job.version} {job.payload}")
+        path = self.workdir.joinpath(shortuuid.uuid())
+        path.mkdir(parents=True)
+        try:
+            builder = await asyncio.get_running_loop().run_in_executor(None, self.prepare, job, path)
+            with builder:
+                await self.build(session, job, builder)
+        except LeaseLost as error:
+            logger.warning(f"Gave up job {job.id}: {error}")
+        except Exception as error:  # pylint: disable=broad-except
+            logger.exception(f"Job {job.id} failed")
+            try:
+                await self._request(session, "POST", f"/{job.id}/complete", json={"error": str(error)})
+            except (ClientError, LeaseLost) as report_error:
+                logger.error(f"Couldn't report failure of job {job.id}: {report_error}")
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+
+    async def _loop(self, session: ClientSession):
+        while self.running:
+            try:
+                job = await self.claim(session)
+            except ClientError as error:
+                logger.error(f"Couldn't claim a job from {self.url}: {error}")
+                job = None
+
+            if job:
+                await self.process(session, job)
+            else:
+                await asyncio.sleep(self.poll_interval)
+
+    async def run(self):
+        self.running = True
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        async with ClientSession(headers=headers) as session:
+            await asyncio.gather(*[self._loop(session) for _ in range(self.concurrency)])
+
+    def stop(self):
+        self.running = False
+
+
+if __name__ == "__main__":
+    if not API_TOKEN:
+        sys.exit("API_TOKEN has to be set to the token of the coordinator")
+    logger.info(f"Worker {WORKER_NAME} pulling jobs from {COORDINATOR_URL}")
+    asyncio.run(Worker(COORDINATOR_URL, WORKER_NAME, API_TOKEN, WORKER_CONCURRENCY, WORKER_DIR).run())